@@ -1,15 +1,29 @@
 import pygame
 import random
 import sys
+import time
+import argparse
+import csv
 import json
 import os
 import math
+import mmap
+import multiprocessing
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict, deque
 
-pygame.init()
-pygame.mixer.init()
+try:
+    import numpy as np
+except ImportError:
+    np = None  # The particle engine falls back to plain Python loops
 
 WIDTH, HEIGHT = 800, 500
 FPS = 60
+SIM_HZ = 60  # Gameplay always advances in fixed ticks of this rate, whatever the display rate
+SIM_DT = 1000 / SIM_HZ
+MAX_FRAME_TIME = 250  # Cap on simulated time per rendered frame so a long stall can't spiral
 GRAVITY = 0.8  # Reduced gravity for easier control
 JUMP_STRENGTH = -12  # Less powerful jump for better control
 
@@ -29,14 +43,77 @@ NEON_PINK = (255, 20, 147)
 NEON_BLUE = (0, 191, 255)
 NEON_ORANGE = (255, 103, 0)
 
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Geometry Dash Clone")
-clock = pygame.time.Clock()
+DISPLAY_FPS = FPS  # Set with --fps, e.g. 30 or 144
 
-title_font = pygame.font.SysFont('Arial', 48, bold=True)
-menu_font = pygame.font.SysFont('Arial', 36)
-font = pygame.font.SysFont('Arial', 24)
-small_font = pygame.font.SysFont('Arial', 18)
+screen = None
+clock = None
+title_font = None
+menu_font = None
+font = None
+small_font = None
+
+def init_display(headless=False):
+    global screen, clock, title_font, menu_font, font, small_font
+    
+    if headless:
+        # No window or audio device; the dummy display still allows offscreen surfaces to be converted
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        pygame.display.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        return
+    
+    # Only the modules the game uses; pygame.init() would also start the mixer, joysticks and
+    # so on. Nothing plays sound yet, so the mixer is left for whoever adds the first one
+    pygame.display.init()
+    pygame.font.init()
+    
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Geometry Dash Clone")
+    clock = pygame.time.Clock()
+    
+    title_font, menu_font, font, small_font = load_fonts([
+        ('Arial', 48, True),
+        ('Arial', 36, False),
+        ('Arial', 24, False),
+        ('Arial', 18, False),
+    ])
+
+FONT_CACHE_FILE = "geometry_dash_fonts.json"
+
+def load_fonts(specs):
+    # SysFont scans every installed font on each lookup, so resolved paths are cached on disk.
+    # Same result as SysFont: missing faces fall back to pygame's default font, missing bold is faked
+    try:
+        with open(FONT_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    
+    changed = False
+    fonts = []
+    for name, size, bold in specs:
+        key = f"{name} bold" if bold else name
+        entry = cache.get(key)
+        if entry is None or not os.path.exists(entry["path"]):
+            path = pygame.font.match_font(name, bold=bold)
+            entry = {"path": path, "fake_bold": bold and path == pygame.font.match_font(name)}
+            if path is not None:  # Don't remember a miss; the font may be installed later
+                cache[key] = entry
+                changed = True
+        
+        loaded = pygame.font.Font(entry["path"], size)
+        if bold and (entry["path"] is None or entry["fake_bold"]):
+            loaded.set_bold(True)
+        fonts.append(loaded)
+    
+    if changed:
+        try:
+            with open(FONT_CACHE_FILE, "w") as f:
+                json.dump(cache, f)
+        except OSError:
+            print("Error saving font cache")
+    return fonts
 
 MAIN_MENU = 0
 LEVEL_SELECT = 1
@@ -51,13 +128,10 @@ BALL = 2
 UFO = 3
 WAVE = 4
 
+MODE_NAMES = ["CUBE", "SHIP", "BALL", "UFO", "WAVE"]
+
 game_state = MAIN_MENU
 current_level = 0
-score = 0
-high_scores = [0, 0, 0]
-challenges_completed = []
-game_mode = CUBE
-game_speed = 1.0
 
 LEVELS = [
     {
@@ -138,30 +212,242 @@ LEVELS = [
     }
 ]
 
+# Game events a challenge can subscribe to; its check only runs when one of them fires
+EVENT_SCORE = "score"
+EVENT_HIGH_SCORE = "high_score"
+EVENT_MODE = "mode"
+EVENT_JUMP = "jump"
+
 CHALLENGES = [
-    {"id": 0, "name": "Beginner", "description": "Score 5 points in any level", "requirement": 5, "completed": False},  # Easier requirement
-    {"id": 1, "name": "Intermediate", "description": "Score 10 points in any level", "requirement": 10, "completed": False},  # Easier requirement
-    {"id": 2, "name": "Expert", "description": "Score 15 points in any level", "requirement": 15, "completed": False},  # Easier requirement
-    {"id": 3, "name": "Level Master", "description": "Complete all levels", "requirement": 3, "completed": False},
-    {"id": 4, "name": "Perfect Run", "description": "Score 10 without jumping more than 20 times", "requirement": 10, "completed": False},  # Easier requirement
-    {"id": 5, "name": "Mode Master", "description": "Use all game modes in a single run", "requirement": 5, "completed": False}
+    {"id": 0, "name": "Beginner", "description": "Score 5 points in any level", "requirement": 5, "completed": False,  # Easier requirement
+     "events": (EVENT_SCORE,), "check": lambda session, c: session.score >= c["requirement"]},
+    {"id": 1, "name": "Intermediate", "description": "Score 10 points in any level", "requirement": 10, "completed": False,  # Easier requirement
+     "events": (EVENT_SCORE,), "check": lambda session, c: session.score >= c["requirement"]},
+    {"id": 2, "name": "Expert", "description": "Score 15 points in any level", "requirement": 15, "completed": False,  # Easier requirement
+     "events": (EVENT_SCORE,), "check": lambda session, c: session.score >= c["requirement"]},
+    {"id": 3, "name": "Level Master", "description": "Complete all levels", "requirement": 3, "completed": False,
+     "events": (EVENT_HIGH_SCORE,), "check": lambda session, c: all(run_history.best_score(i) >= 10 for i in range(len(LEVELS)))},  # Easier requirement (10 instead of 15)
+    {"id": 4, "name": "Perfect Run", "description": "Score 10 without jumping more than 20 times", "requirement": 10, "completed": False,  # Easier requirement
+     # More jumps can only break this one, so it never needs to run on EVENT_JUMP
+     "events": (EVENT_SCORE,), "check": lambda session, c: session.score >= c["requirement"] and (session.game_mode != CUBE or session.player.jump_count <= 20)},
+    {"id": 5, "name": "Mode Master", "description": "Use all game modes in a single run", "requirement": 5, "completed": False,
+     "events": (EVENT_MODE,), "check": lambda session, c: len(session.used_game_modes) >= c["requirement"]}
 ]
 
-def save_game_data():
-    data = {
-        "high_scores": high_scores,
+class ChallengeEngine:
+    # Challenges indexed by the events they subscribe to. Completed ones are dropped from an
+    # event's list the next time it fires, so finished challenges cost nothing
+    def __init__(self, challenges):
+        self.subscribers = {}
+        for challenge in challenges:
+            for event in challenge["events"]:
+                self.subscribers.setdefault(event, []).append(challenge)
+    
+    def emit(self, event, session):
+        subscribers = self.subscribers.get(event)
+        if not subscribers:
+            return
+        
+        remaining = []
+        for challenge in subscribers:
+            if not challenge["completed"] and challenge["check"](session, challenge):
+                challenge["completed"] = True
+                save_service.mark_dirty()
+            if not challenge["completed"]:
+                remaining.append(challenge)
+        if len(remaining) < len(subscribers):
+            self.subscribers[event] = remaining
+
+challenge_engine = ChallengeEngine(CHALLENGES)
+
+SAVE_FILE = "geometry_dash_save.json"
+
+def game_data_snapshot():
+    return {
+        "high_scores": list(run_history.best),
         "challenges": [c["completed"] for c in CHALLENGES]
     }
-    with open("geometry_dash_save.json", "w") as f:
-        json.dump(data, f)
+
+class SaveService:
+    # Gameplay only marks the save dirty. flush() at safe points (death, pause, quit) hands a
+    # snapshot to a background thread, which writes a temp file and swaps it in with os.replace
+    def __init__(self, path=SAVE_FILE):
+        self.path = path
+        self.dirty = False
+        self.pending = None
+        self.closing = False
+        self.wake = threading.Condition()
+        self.thread = None
+    
+    def mark_dirty(self):
+        self.dirty = True
+    
+    def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        with self.wake:
+            self.pending = game_data_snapshot()  # A newer snapshot replaces one the writer hasn't reached
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="save-writer", daemon=True)
+                self.thread.start()
+            self.wake.notify()
+    
+    def run(self):
+        while True:
+            with self.wake:
+                while self.pending is None and not self.closing:
+                    self.wake.wait()
+                data, self.pending = self.pending, None
+            if data is None:
+                return
+            self.write(data)
+    
+    def write(self, data):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError:
+            print("Error saving game data")
+    
+    def close(self):
+        # Final flush; waits for the writer so quitting never loses the last save
+        self.flush()
+        with self.wake:
+            self.closing = True
+            self.wake.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.closing = False
+
+save_service = SaveService()
+
+RUN_HISTORY_FILE = "geometry_dash_runs.db"
+RUN_HISTORY_COMPACT_EVERY = 500  # Runs between WAL checkpoints
+RUN_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    level INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    jumps INTEGER NOT NULL,
+    modes INTEGER NOT NULL,
+    death_x REAL,
+    duration_ms REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_level ON runs (level, score DESC);
+CREATE TABLE IF NOT EXISTS run_modes (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    mode INTEGER NOT NULL,
+    score INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS run_modes_by_mode ON run_modes (mode, score DESC);
+"""
+
+class RunHistory:
+    # Every finished run goes into SQLite. Best scores per level are aggregated once when the
+    # database opens and then kept current in memory, so menus never have to query it
+    def __init__(self, path=RUN_HISTORY_FILE):
+        self.path = path
+        self.connection = None
+        self.pending = []
+        self.best = [0] * len(LEVELS)
+        self.since_compact = 0
+    
+    def open(self):
+        try:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(RUN_HISTORY_SCHEMA)
+            for level, best in connection.execute("SELECT level, MAX(score) FROM runs GROUP BY level"):
+                self.note_score(level, best)
+        except sqlite3.Error:
+            print("Error opening run history")
+            return
+        self.connection = connection
+    
+    def best_score(self, level_index):
+        return self.best[level_index]
+    
+    def note_score(self, level_index, score):
+        if 0 <= level_index < len(self.best) and score > self.best[level_index]:
+            self.best[level_index] = score
+    
+    def record(self, session, died):
+        # death_x is the world x where the run ended; quitting leaves it NULL
+        modes = sum(1 << mode for mode in session.used_game_modes)
+        death_x = session.distance + session.player.x if died else None
+        self.pending.append(((session.level_index, session.score, session.jumps, modes, death_x, session.sim_time, time.time()),
+                             sorted(session.used_game_modes)))
+        self.note_score(session.level_index, session.score)
+    
+    def flush(self):
+        # All queued runs go in as one transaction
+        if self.connection is None or not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        try:
+            with self.connection:
+                mode_rows = []
+                for run, used_modes in pending:
+                    run_id = self.connection.execute(
+                        "INSERT INTO runs (level, score, jumps, modes, death_x, duration_ms, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        run).lastrowid
+                    mode_rows.extend((run_id, mode, run[1]) for mode in used_modes)
+                self.connection.executemany("INSERT INTO run_modes (run_id, mode, score) VALUES (?, ?, ?)", mode_rows)
+        except sqlite3.Error:
+            print("Error saving run history")
+            return
+        
+        self.since_compact += len(pending)
+        if self.since_compact >= RUN_HISTORY_COMPACT_EVERY:
+            self.compact()
+    
+    def compact(self):
+        # Fold the WAL back into the database and refresh the planner's statistics
+        self.since_compact = 0
+        try:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.connection.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            print("Error compacting run history")
+    
+    def best_runs(self, level_index=None, mode=None, limit=10):
+        # Rows are (level, score, jumps, modes, death_x, duration_ms, finished_at)
+        if self.connection is None:
+            return []
+        columns = "runs.level, runs.score, runs.jumps, runs.modes, runs.death_x, runs.duration_ms, runs.finished_at"
+        if mode is not None:
+            query = (f"SELECT {columns} FROM run_modes JOIN runs ON runs.id = run_modes.run_id"
+                     " WHERE run_modes.mode = ? ORDER BY run_modes.score DESC LIMIT ?")
+            return self.connection.execute(query, (mode, limit)).fetchall()
+        query = f"SELECT {columns} FROM runs WHERE level = ? ORDER BY score DESC LIMIT ?"
+        return self.connection.execute(query, (level_index, limit)).fetchall()
+    
+    def close(self):
+        if self.connection is None:
+            return
+        self.flush()
+        self.compact()
+        self.connection.close()
+        self.connection = None
+
+run_history = RunHistory()
 
 def load_game_data():
-    global high_scores
-    if os.path.exists("geometry_dash_save.json"):
+    if os.path.exists(SAVE_FILE):
         try:
-            with open("geometry_dash_save.json", "r") as f:
+            with open(SAVE_FILE, "r") as f:
                 data = json.load(f)
-                high_scores = data.get("high_scores", [0, 0, 0])
+                # Scores from saves that predate the run history still count as bests
+                for level_index, best in enumerate(data.get("high_scores", [])):
+                    run_history.note_score(level_index, best)
                 challenge_status = data.get("challenges", [False] * len(CHALLENGES))
                 for i, status in enumerate(challenge_status):
                     if i < len(CHALLENGES):
@@ -169,6 +455,72 @@ def load_game_data():
         except:
             print("Error loading save data")
 
+PLAYER_ROTATION_STEP = 5  # Matches the cube's rotation per frame
+
+class SpriteCache:
+    def __init__(self, step=PLAYER_ROTATION_STEP):
+        self.step = step
+        self.frames = {}
+    
+    def bake(self, owner, color):
+        base = owner.build_surface(color)
+        frames = []
+        for i in range(360 // self.step):
+            rotated = pygame.transform.rotate(base, i * self.step).convert_alpha()
+            frames.append((rotated, rotated.get_width() // 2, rotated.get_height() // 2))
+        return frames
+    
+    def get_frame(self, owner, color, rotation):
+        # One baked set of rotations per player class and color (the invincibility flash is just WHITE)
+        key = (owner.__class__, color)
+        frames = self.frames.get(key)
+        if frames is None:
+            frames = self.bake(owner, color)
+            self.frames[key] = frames
+        return frames[int(round(rotation / self.step)) % len(frames)]
+
+sprite_cache = SpriteCache()
+
+SHAPE_ROTATION_STEP = 5
+SHAPE_ATLAS_BUDGET = 8 * 1024 * 1024  # Bytes of baked shape surfaces kept around
+TEXTURE_CACHE_BUDGET = 24 * 1024 * 1024  # Bytes of baked ground/platform textures
+
+class SurfaceCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.entries = OrderedDict()
+    
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        self.entries.move_to_end(key)
+        return item[0]
+    
+    def put(self, key, entry):
+        surface = entry[0] if isinstance(entry, tuple) else entry
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used -= old[1]
+        self.entries[key] = (entry, size)
+        self.used += size
+        
+        while self.used > self.budget and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.used -= evicted_size
+
+shape_atlas = SurfaceCache(SHAPE_ATLAS_BUDGET)
+texture_cache = SurfaceCache(TEXTURE_CACHE_BUDGET)
+
+def get_texture(owner):
+    texture = texture_cache.get(owner.texture_key)
+    if texture is None:
+        texture = owner.bake_texture()
+        texture_cache.put(owner.texture_key, texture)
+    return texture
+
 class CubePlayer:
     def __init__(self, color=BLUE):
         self.width = 30
@@ -184,6 +536,7 @@ class CubePlayer:
         self.mode = CUBE
         self.invincible = False  # Add invincibility frames
         self.invincible_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
     def jump(self):
         if self.on_ground:
@@ -214,15 +567,10 @@ class CubePlayer:
         self.invincible = True
         self.invincible_timer = duration
     
-    def draw(self):
+    def build_surface(self, color):
         player_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
         
-        if self.invincible and self.invincible_timer % 4 < 2:  # Flashing effect when invincible
-            draw_color = WHITE
-        else:
-            draw_color = self.color
-            
-        pygame.draw.rect(player_surface, draw_color, (0, 0, self.width, self.height))
+        pygame.draw.rect(player_surface, color, (0, 0, self.width, self.height))
         
         pygame.draw.line(player_surface, BLACK, (0, 0), (self.width, 0), 2)
         pygame.draw.line(player_surface, BLACK, (0, 0), (0, self.height), 2)
@@ -233,16 +581,21 @@ class CubePlayer:
         pygame.draw.circle(player_surface, WHITE, (3*self.width//4, self.height//3), 5)
         pygame.draw.circle(player_surface, BLACK, (self.width//4, self.height//3), 2)
         pygame.draw.circle(player_surface, BLACK, (3*self.width//4, self.height//3), 2)
-        
-        if self.jumping:
-            rotated_surface = pygame.transform.rotate(player_surface, self.rotation)
-            rotated_rect = rotated_surface.get_rect(center=(self.x + self.width//2, self.y + self.height//2))
-            screen.blit(rotated_surface, rotated_rect.topleft)
+        return player_surface
+    
+    def draw(self, surface):
+        if self.invincible and self.invincible_timer % 4 < 2:  # Flashing effect when invincible
+            draw_color = WHITE
         else:
-            screen.blit(player_surface, (self.x, self.y))
+            draw_color = self.color
+        
+        rotation = self.rotation if self.jumping else 0
+        frame, half_w, half_h = sprite_cache.get_frame(self, draw_color, rotation)
+        surface.blit(frame, (self.x + self.width//2 - half_w, self.y + self.height//2 - half_h))
     
     def get_rect(self):
-        return pygame.Rect(self.x + 5, self.y + 5, self.width - 10, self.height - 10)  # Smaller hitbox
+        self.hitbox.update(self.x + 5, self.y + 5, self.width - 10, self.height - 10)  # Smaller hitbox
+        return self.hitbox
 
 class ShipPlayer:
     def __init__(self, color=BLUE):
@@ -256,6 +609,7 @@ class ShipPlayer:
         self.mode = SHIP
         self.invincible = False
         self.invincible_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
     def jump(self):
         self.vel_y = -1.5  # Gentler upward force
@@ -283,15 +637,10 @@ class ShipPlayer:
         self.invincible = True
         self.invincible_timer = duration
     
-    def draw(self):
+    def build_surface(self, color):
         ship_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
         
-        if self.invincible and self.invincible_timer % 4 < 2:
-            draw_color = WHITE
-        else:
-            draw_color = self.color
-        
-        pygame.draw.polygon(ship_surface, draw_color, [
+        pygame.draw.polygon(ship_surface, color, [
             (0, self.height//2),
             (self.width//4, 0),
             (self.width, self.height//2),
@@ -304,13 +653,20 @@ class ShipPlayer:
         pygame.draw.line(ship_surface, BLACK, (self.width//4, self.height), (0, self.height//2), 2)
         
         pygame.draw.circle(ship_surface, WHITE, (self.width//2, self.height//2), 5)
+        return ship_surface
+    
+    def draw(self, surface):
+        if self.invincible and self.invincible_timer % 4 < 2:
+            draw_color = WHITE
+        else:
+            draw_color = self.color
         
-        rotated_surface = pygame.transform.rotate(ship_surface, self.rotation)
-        rotated_rect = rotated_surface.get_rect(center=(self.x + self.width//2, self.y + self.height//2))
-        screen.blit(rotated_surface, rotated_rect.topleft)
+        frame, half_w, half_h = sprite_cache.get_frame(self, draw_color, self.rotation)
+        surface.blit(frame, (self.x + self.width//2 - half_w, self.y + self.height//2 - half_h))
     
     def get_rect(self):
-        return pygame.Rect(self.x + 8, self.y + 8, self.width - 16, self.height - 16)  # Even smaller hitbox for ship
+        self.hitbox.update(self.x + 8, self.y + 8, self.width - 16, self.height - 16)  # Even smaller hitbox for ship
+        return self.hitbox
 
 class BallPlayer:
     def __init__(self, color=BLUE):
@@ -325,6 +681,7 @@ class BallPlayer:
         self.mode = BALL
         self.invincible = False
         self.invincible_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
     def jump(self):
         if self.on_ground:
@@ -367,22 +724,23 @@ class BallPlayer:
         self.invincible = True
         self.invincible_timer = duration
     
-    def draw(self):
+    def draw(self, surface):
         if self.invincible and self.invincible_timer % 4 < 2:
             draw_color = WHITE
         else:
             draw_color = self.color
             
-        pygame.draw.circle(screen, draw_color, (int(self.x), int(self.y)), self.radius)
-        pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y)), self.radius, 2)
+        pygame.draw.circle(surface, draw_color, (int(self.x), int(self.y)), self.radius)
+        pygame.draw.circle(surface, BLACK, (int(self.x), int(self.y)), self.radius, 2)
         
         angle = math.radians(self.rotation)
         end_x = self.x + math.cos(angle) * self.radius
         end_y = self.y + math.sin(angle) * self.radius
-        pygame.draw.line(screen, BLACK, (self.x, self.y), (end_x, end_y), 2)
+        pygame.draw.line(surface, BLACK, (self.x, self.y), (end_x, end_y), 2)
     
     def get_rect(self):
-        return pygame.Rect(self.x - self.radius + 5, self.y - self.radius + 5, self.radius * 2 - 10, self.radius * 2 - 10)  # Smaller hitbox
+        self.hitbox.update(self.x - self.radius + 5, self.y - self.radius + 5, self.radius * 2 - 10, self.radius * 2 - 10)  # Smaller hitbox
+        return self.hitbox
 
 class UfoPlayer:
     def __init__(self, color=BLUE):
@@ -397,6 +755,7 @@ class UfoPlayer:
         self.hover_direction = 1
         self.invincible = False
         self.invincible_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
     def jump(self):
         self.vel_y = -6  # Less powerful jump
@@ -423,28 +782,29 @@ class UfoPlayer:
         self.invincible = True
         self.invincible_timer = duration
     
-    def draw(self):
+    def draw(self, surface):
         if self.invincible and self.invincible_timer % 4 < 2:
             draw_color = WHITE
         else:
             draw_color = self.color
             
-        pygame.draw.ellipse(screen, draw_color, (self.x, self.y + self.hover_offset, self.width, self.height))
-        pygame.draw.ellipse(screen, BLACK, (self.x, self.y + self.hover_offset, self.width, self.height), 2)
+        pygame.draw.ellipse(surface, draw_color, (self.x, self.y + self.hover_offset, self.width, self.height))
+        pygame.draw.ellipse(surface, BLACK, (self.x, self.y + self.hover_offset, self.width, self.height), 2)
         
-        pygame.draw.arc(screen, draw_color, (self.x + 5, self.y + self.hover_offset - 10, self.width - 10, 20), 
+        pygame.draw.arc(surface, draw_color, (self.x + 5, self.y + self.hover_offset - 10, self.width - 10, 20), 
                         math.pi, 2 * math.pi, 3)
-        pygame.draw.arc(screen, BLACK, (self.x + 5, self.y + self.hover_offset - 10, self.width - 10, 20), 
+        pygame.draw.arc(surface, BLACK, (self.x + 5, self.y + self.hover_offset - 10, self.width - 10, 20), 
                         math.pi, 2 * math.pi, 2)
         
-        pygame.draw.polygon(screen, YELLOW, [
+        pygame.draw.polygon(surface, YELLOW, [
             (self.x + self.width // 2, self.y + self.hover_offset + self.height),
             (self.x + self.width // 2 - 5, self.y + self.hover_offset + self.height + 10),
             (self.x + self.width // 2 + 5, self.y + self.hover_offset + self.height + 10)
         ])
     
     def get_rect(self):
-        return pygame.Rect(self.x + 8, self.y + self.hover_offset + 8, self.width - 16, self.height - 10)  # Smaller hitbox
+        self.hitbox.update(self.x + 8, self.y + self.hover_offset + 8, self.width - 16, self.height - 10)  # Smaller hitbox
+        return self.hitbox
 
 class WavePlayer:
     def __init__(self, color=BLUE):
@@ -459,6 +819,7 @@ class WavePlayer:
         self.trail_length = 20
         self.invincible = False
         self.invincible_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
     def jump(self):
         self.direction = -1
@@ -484,7 +845,7 @@ class WavePlayer:
         self.invincible = True
         self.invincible_timer = duration
     
-    def draw(self):
+    def draw(self, surface):
         if self.invincible and self.invincible_timer % 4 < 2:
             draw_color = WHITE
         else:
@@ -497,53 +858,88 @@ class WavePlayer:
                     trail_color = (255, 255, 255, alpha)
                 else:
                     trail_color = (*self.color, alpha)
-                pygame.draw.line(screen, trail_color, 
+                pygame.draw.line(surface, trail_color, 
                                 self.wave_points[i], self.wave_points[i+1], 
                                 3 - int(2 * (i / self.trail_length)))
         
-        pygame.draw.circle(screen, draw_color, (int(self.x), int(self.y)), 5)
-        pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y)), 5, 1)
+        pygame.draw.circle(surface, draw_color, (int(self.x), int(self.y)), 5)
+        pygame.draw.circle(surface, BLACK, (int(self.x), int(self.y)), 5, 1)
     
     def get_rect(self):
-        return pygame.Rect(self.x - 3, self.y - 3, 6, 6)  # Much smaller hitbox for wave
+        self.hitbox.update(self.x - 3, self.y - 3, 6, 6)  # Much smaller hitbox for wave
+        return self.hitbox
+
+# Cosmetic draws (glow, particles, decoration shapes) come from their own stream, which each
+# session reseeds, so gameplay never depends on what was drawn or how often
+visual_random = random.Random()
+
+# How the session reacts when the player touches an obstacle
+KIND_SOLID = 0
+KIND_PORTAL = 1
+KIND_SPEED_PORTAL = 2
 
 class Obstacle:
+    __slots__ = ("width", "height", "x", "y", "color", "passed", "decoration", "texture_key",
+                 "hitbox", "prev_x", "prev_y")
+    kind = KIND_SOLID
+    hitbox_inset = 3
+    animated = False
+    
     def __init__(self, x, height, color=RED):
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
+        self.reset(x, height, color)
+    
+    def reset(self, x, height, color=RED):
         self.width = 30
         self.height = height
         self.x = x
         self.y = HEIGHT - 50 - self.height
         self.color = color
         self.passed = False
-        self.decoration = random.randint(0, 3)
-    
-    def update(self, scroll_speed):
-        self.x -= scroll_speed
+        self.decoration = visual_random.randint(0, 3)
+        self.texture_key = ("obstacle", self.width, int(self.height), self.color, self.decoration)
     
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, BLACK, (self.x, self.y, self.width, self.height), 2)
+    def bake_texture(self):
+        width, height = self.texture_key[1], self.texture_key[2]
+        texture = pygame.Surface((width, height)).convert()
+        texture.fill(self.color)
+        pygame.draw.rect(texture, BLACK, (0, 0, width, height), 2)
         
         if self.decoration == 0:
-            for i in range(0, self.height, 10):
-                pygame.draw.line(screen, BLACK, (self.x, self.y + i), (self.x + self.width, self.y + i), 1)
+            for i in range(0, height, 10):
+                pygame.draw.line(texture, BLACK, (0, i), (width, i), 1)
         elif self.decoration == 1:
-            for i in range(0, self.height, 10):
-                for j in range(0, self.width, 10):
-                    pygame.draw.circle(screen, BLACK, (self.x + j + 5, self.y + i + 5), 2)
+            for i in range(0, height, 10):
+                for j in range(0, width, 10):
+                    pygame.draw.circle(texture, BLACK, (j + 5, i + 5), 2)
         elif self.decoration == 2:
-            pygame.draw.line(screen, BLACK, (self.x, self.y), (self.x + self.width, self.y + self.height), 2)
-            pygame.draw.line(screen, BLACK, (self.x + self.width, self.y), (self.x, self.y + self.height), 2)
+            pygame.draw.line(texture, BLACK, (0, 0), (width, height), 2)
+            pygame.draw.line(texture, BLACK, (width, 0), (0, height), 2)
         else:
-            pygame.draw.line(screen, BLACK, (self.x + 5, self.y + 5), (self.x + self.width - 5, self.y + 5), 2)
-            pygame.draw.line(screen, BLACK, (self.x + 5, self.y + self.height - 5), 
-                            (self.x + self.width - 5, self.y + self.height - 5), 2)
+            pygame.draw.line(texture, BLACK, (5, 5), (width - 5, 5), 2)
+            pygame.draw.line(texture, BLACK, (5, height - 5), (width - 5, height - 5), 2)
+        return texture
+    
+    def draw(self, surface):
+        surface.blit(get_texture(self), (self.x, self.y))
     
     def get_rect(self):
-        return pygame.Rect(self.x + 3, self.y + 3, self.width - 6, self.height - 6)  # Smaller hitbox
+        inset = self.hitbox_inset
+        self.hitbox.update(self.x + inset, self.y + inset, self.width - 2 * inset, self.height - 2 * inset)
+        return self.hitbox
 
 class Spike:
+    __slots__ = ("width", "height", "x", "upside_down", "y", "color", "passed", "glow", "hitbox",
+                 "prev_x", "prev_y")
+    kind = KIND_SOLID
+    hitbox_inset = 8
+    animated = True
+    
     def __init__(self, x, color=RED, upside_down=False):
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
+        self.reset(x, color, upside_down)
+    
+    def reset(self, x, color=RED, upside_down=False):
         self.width = 30
         self.height = 30
         self.x = x
@@ -556,11 +952,10 @@ class Spike:
         self.passed = False
         self.glow = False
     
-    def update(self, scroll_speed):
-        self.x -= scroll_speed
-        self.glow = random.random() < 0.02
+    def animate(self, x):
+        self.glow = visual_random.random() < 0.02
     
-    def draw(self):
+    def draw(self, surface):
         if self.upside_down:
             points = [
                 (self.x, self.y),
@@ -576,50 +971,67 @@ class Spike:
         
         if self.glow:
             glow_color = (min(255, self.color[0] + 50), min(255, self.color[1] + 50), min(255, self.color[2] + 50))
-            pygame.draw.polygon(screen, glow_color, points)
+            pygame.draw.polygon(surface, glow_color, points)
         else:
-            pygame.draw.polygon(screen, self.color, points)
+            pygame.draw.polygon(surface, self.color, points)
         
-        pygame.draw.polygon(screen, BLACK, points, 2)
+        pygame.draw.polygon(surface, BLACK, points, 2)
         
         if self.upside_down:
-            pygame.draw.line(screen, BLACK, 
+            pygame.draw.line(surface, BLACK, 
                             (self.x + 10, self.y + 10), 
                             (self.x + self.width - 10, self.y + 10), 2)
         else:
-            pygame.draw.line(screen, BLACK, 
+            pygame.draw.line(surface, BLACK, 
                             (self.x + 10, self.y + self.height - 10), 
                             (self.x + self.width - 10, self.y + self.height - 10), 2)
     
     def get_rect(self):
-        if self.upside_down:
-            return pygame.Rect(self.x + 8, self.y + 8, self.width - 16, self.height - 16)  # Smaller hitbox
-        else:
-            return pygame.Rect(self.x + 8, self.y + 8, self.width - 16, self.height - 16)  # Smaller hitbox
+        inset = self.hitbox_inset
+        self.hitbox.update(self.x + inset, self.y + inset, self.width - 2 * inset, self.height - 2 * inset)
+        return self.hitbox
 
 class Platform:
+    __slots__ = ("x", "y", "width", "height", "color", "passed", "texture_key", "hitbox",
+                 "prev_x", "prev_y")
+    kind = KIND_SOLID
+    hitbox_inset = 3
+    animated = False
+    
     def __init__(self, x, y, width, height, color=GREEN):
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
+        self.reset(x, y, width, height, color)
+    
+    def reset(self, x, y, width, height, color=GREEN):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
         self.color = color
         self.passed = False
+        # Slabs that run past the bottom of the screen only bake the part that can be seen
+        visible_height = max(1, min(int(height), HEIGHT - int(y)))
+        self.texture_key = ("platform", int(width), int(height), visible_height, color)
     
-    def update(self, scroll_speed):
-        self.x -= scroll_speed
-    
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, BLACK, (self.x, self.y, self.width, self.height), 2)
+    def bake_texture(self):
+        _, width, height, visible_height, _ = self.texture_key
+        texture = pygame.Surface((width, visible_height)).convert()
+        texture.fill(self.color)
+        pygame.draw.rect(texture, BLACK, (0, 0, width, height), 2)
         
-        for i in range(0, self.width, 20):
-            pygame.draw.line(screen, BLACK, (self.x + i, self.y), (self.x + i, self.y + self.height), 1)
-        for i in range(0, self.height, 10):
-            pygame.draw.line(screen, BLACK, (self.x, self.y + i), (self.x + self.width, self.y + i), 1)
+        for i in range(0, width, 20):
+            pygame.draw.line(texture, BLACK, (i, 0), (i, height), 1)
+        for i in range(0, visible_height, 10):
+            pygame.draw.line(texture, BLACK, (0, i), (width, i), 1)
+        return texture
+    
+    def draw(self, surface):
+        surface.blit(get_texture(self), (self.x, self.y))
     
     def get_rect(self):
-        return pygame.Rect(self.x + 3, self.y + 3, self.width - 6, self.height - 6)  # Smaller hitbox
+        inset = self.hitbox_inset
+        self.hitbox.update(self.x + inset, self.y + inset, self.width - 2 * inset, self.height - 2 * inset)
+        return self.hitbox
 
 class Ground:
     def __init__(self, color=GREEN):
@@ -629,19 +1041,35 @@ class Ground:
         self.y = HEIGHT - self.height
         self.color = color
         self.offset = 0
+        self.prev_offset = 0
+        self.texture_key = ("ground", self.width, self.height, color)
     
     def update(self, scroll_speed):
+        self.prev_offset = self.offset
         self.offset = (self.offset + scroll_speed) % 20
     
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
+    def bake_texture(self):
+        # One tile wider than the screen so the strip can slide left by up to a full tile
+        texture = pygame.Surface((self.width + 20, self.height)).convert()
+        texture.fill(self.color)
         
-        for i in range(-int(self.offset), WIDTH, 20):
-            pygame.draw.line(screen, BLACK, (i, self.y), (i, HEIGHT), 1)
-        for i in range(self.y, HEIGHT, 10):
-            pygame.draw.line(screen, BLACK, (0, i), (WIDTH, i), 1)
+        for i in range(0, self.width + 20, 20):
+            pygame.draw.line(texture, BLACK, (i, 0), (i, self.height), 1)
+        for i in range(0, self.height, 10):
+            pygame.draw.line(texture, BLACK, (0, i), (self.width + 20, i), 1)
+        return texture
+    
+    def draw(self, surface, alpha=1.0):
+        offset = (self.prev_offset + (self.offset - self.prev_offset) % 20 * alpha) % 20
+        surface.blit(get_texture(self), (-int(offset), self.y))
 
 class Portal:
+    __slots__ = ("width", "height", "x", "y", "target_mode", "color", "passed", "particle_timer",
+                 "hitbox", "prev_x", "prev_y")
+    kind = KIND_PORTAL
+    hitbox_inset = 5
+    animated = True
+    
     def __init__(self, x, target_mode, color):
         self.width = 40
         self.height = 80
@@ -650,63 +1078,54 @@ class Portal:
         self.target_mode = target_mode
         self.color = color
         self.passed = False
-        self.particles = []
         self.particle_timer = 0
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
-    def update(self, scroll_speed):
-        self.x -= scroll_speed
-        
+    def animate(self, x):
         self.particle_timer += 1
         if self.particle_timer >= 5:
             self.particle_timer = 0
-            self.particles.append({
-                'x': self.x + self.width//2,
-                'y': random.randint(int(self.y), int(self.y + self.height)),
-                'size': random.randint(2, 5),
-                'life': 30
-            })
-        
-        for particle in self.particles[:]:
-            particle['life'] -= 1
-            if particle['life'] <= 0:
-                self.particles.remove(particle)
+            particle_engine.emit(x + self.width//2,
+                                 visual_random.randint(int(self.y), int(self.y + self.height)),
+                                 0, 0, visual_random.randint(2, 5), 30, self.color)
     
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height), border_radius=10)
-        pygame.draw.rect(screen, BLACK, (self.x, self.y, self.width, self.height), 2, border_radius=10)
+    def draw(self, surface):
+        pygame.draw.rect(surface, self.color, (self.x, self.y, self.width, self.height), border_radius=10)
+        pygame.draw.rect(surface, BLACK, (self.x, self.y, self.width, self.height), 2, border_radius=10)
         
         for i in range(0, self.height, 10):
-            pygame.draw.arc(screen, WHITE, 
+            pygame.draw.arc(surface, WHITE, 
                            (self.x + 5, self.y + i, self.width - 10, 10), 
                            0, math.pi, 2)
         
-        for particle in self.particles:
-            alpha = int(255 * (particle['life'] / 30))
-            particle_color = (*self.color, alpha)
-            pygame.draw.circle(screen, particle_color, 
-                              (int(particle['x']), int(particle['y'])), 
-                              particle['size'])
-        
         if self.target_mode == CUBE:
-            pygame.draw.rect(screen, WHITE, (self.x + 10, self.y + 30, 20, 20))
+            pygame.draw.rect(surface, WHITE, (self.x + 10, self.y + 30, 20, 20))
         elif self.target_mode == SHIP:
-            pygame.draw.polygon(screen, WHITE, [
+            pygame.draw.polygon(surface, WHITE, [
                 (self.x + 10, self.y + 40),
                 (self.x + 20, self.y + 30),
                 (self.x + 30, self.y + 40),
                 (self.x + 20, self.y + 50)
             ])
         elif self.target_mode == BALL:
-            pygame.draw.circle(screen, WHITE, (self.x + 20, self.y + 40), 10)
+            pygame.draw.circle(surface, WHITE, (self.x + 20, self.y + 40), 10)
         elif self.target_mode == UFO:
-            pygame.draw.ellipse(screen, WHITE, (self.x + 10, self.y + 40, 20, 10))
+            pygame.draw.ellipse(surface, WHITE, (self.x + 10, self.y + 40, 20, 10))
         elif self.target_mode == WAVE:
-            pygame.draw.line(screen, WHITE, (self.x + 10, self.y + 40), (self.x + 30, self.y + 40), 3)
+            pygame.draw.line(surface, WHITE, (self.x + 10, self.y + 40), (self.x + 30, self.y + 40), 3)
     
     def get_rect(self):
-        return pygame.Rect(self.x + 5, self.y + 5, self.width - 10, self.height - 10)
+        inset = self.hitbox_inset
+        self.hitbox.update(self.x + inset, self.y + inset, self.width - 2 * inset, self.height - 2 * inset)
+        return self.hitbox
 
 class SpeedPortal:
+    __slots__ = ("width", "height", "x", "y", "speed_multiplier", "color", "passed", "hitbox",
+                 "prev_x", "prev_y")
+    kind = KIND_SPEED_PORTAL
+    hitbox_inset = 5
+    animated = True
+    
     def __init__(self, x, speed_multiplier, color):
         self.width = 30
         self.height = 60
@@ -715,153 +1134,318 @@ class SpeedPortal:
         self.speed_multiplier = speed_multiplier
         self.color = color
         self.passed = False
-        self.particles = []
+        self.hitbox = pygame.Rect(0, 0, 0, 0)
     
-    def update(self, scroll_speed):
-        self.x -= scroll_speed
-        
-        if random.random() < 0.2:
-            self.particles.append({
-                'x': self.x + self.width//2,
-                'y': random.randint(int(self.y), int(self.y + self.height)),
-                'vx': -random.uniform(1, 3),
-                'vy': random.uniform(-1, 1),
-                'size': random.randint(2, 4),
-                'life': 20
-            })
-        
-        for particle in self.particles[:]:
-            particle['x'] += particle['vx']
-            particle['y'] += particle['vy']
-            particle['life'] -= 1
-            if particle['life'] <= 0:
-                self.particles.remove(particle)
+    def animate(self, x):
+        if visual_random.random() < 0.2:
+            particle_engine.emit(x + self.width//2,
+                                 visual_random.randint(int(self.y), int(self.y + self.height)),
+                                 -visual_random.uniform(1, 3), visual_random.uniform(-1, 1),
+                                 visual_random.randint(2, 4), 20, self.color)
     
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height), border_radius=8)
-        pygame.draw.rect(screen, BLACK, (self.x, self.y, self.width, self.height), 2, border_radius=8)
+    def draw(self, surface):
+        pygame.draw.rect(surface, self.color, (self.x, self.y, self.width, self.height), border_radius=8)
+        pygame.draw.rect(surface, BLACK, (self.x, self.y, self.width, self.height), 2, border_radius=8)
         
         if self.speed_multiplier == 0.5:
-            pygame.draw.polygon(screen, WHITE, [
+            pygame.draw.polygon(surface, WHITE, [
                 (self.x + 15, self.y + 20),
                 (self.x + 5, self.y + 30),
                 (self.x + 15, self.y + 40)
             ])
         elif self.speed_multiplier == 1:
-            pygame.draw.polygon(screen, WHITE, [
+            pygame.draw.polygon(surface, WHITE, [
                 (self.x + 10, self.y + 20),
                 (self.x + 20, self.y + 30),
                 (self.x + 10, self.y + 40)
             ])
         elif self.speed_multiplier == 1.5:
             for i in range(2):
-                pygame.draw.polygon(screen, WHITE, [
+                pygame.draw.polygon(surface, WHITE, [
                     (self.x + 5 + i*10, self.y + 20),
                     (self.x + 15 + i*10, self.y + 30),
                     (self.x + 5 + i*10, self.y + 40)
                 ])
         elif self.speed_multiplier == 2:
             for i in range(3):
-                pygame.draw.polygon(screen, WHITE, [
+                pygame.draw.polygon(surface, WHITE, [
                     (self.x + 5 + i*7, self.y + 20),
                     (self.x + 12 + i*7, self.y + 30),
                     (self.x + 5 + i*7, self.y + 40)
                 ])
-        
-        for particle in self.particles:
-            alpha = int(255 * (particle['life'] / 20))
-            particle_color = (*self.color, alpha)
-            pygame.draw.circle(screen, particle_color, 
-                              (int(particle['x']), int(particle['y'])), 
-                              particle['size'])
     
     def get_rect(self):
-        return pygame.Rect(self.x + 5, self.y + 5, self.width - 10, self.height - 10)
+        inset = self.hitbox_inset
+        self.hitbox.update(self.x + inset, self.y + inset, self.width - 2 * inset, self.height - 2 * inset)
+        return self.hitbox
+
+STAR_POINTS = []
+for i in range(5):
+    STAR_POINTS.append((math.cos(math.radians(i * 72)), math.sin(math.radians(i * 72)), 2))
+    STAR_POINTS.append((math.cos(math.radians(i * 72 + 36)), math.sin(math.radians(i * 72 + 36)), 4))
+
+def bake_shape(shape, size, color, outline, angle):
+    if shape == "circle":
+        radius = size//2
+        surface = pygame.Surface((radius * 2 + 2, radius * 2 + 2), pygame.SRCALPHA)
+        center = (radius + 1, radius + 1)
+        pygame.draw.circle(surface, color, center, radius)
+        if outline:
+            pygame.draw.circle(surface, BLACK, center, radius, 1)
+            end_x = center[0] + math.cos(math.radians(angle)) * radius
+            end_y = center[1] + math.sin(math.radians(angle)) * radius
+            pygame.draw.line(surface, BLACK, center, (end_x, end_y), 1)
+        rotated = surface
+    else:
+        surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        
+        if shape == "square":
+            pygame.draw.rect(surface, color, (0, 0, size, size))
+            if outline:
+                pygame.draw.rect(surface, BLACK, (0, 0, size, size), 1)
+        else:
+            if shape == "triangle":
+                points = [(size//2, 0), (0, size), (size, size)]
+            else:
+                points = [(size//2 + c * (size//d), size//2 + s * (size//d)) for c, s, d in STAR_POINTS]
+            pygame.draw.polygon(surface, color, points)
+            if outline:
+                pygame.draw.polygon(surface, BLACK, points, 1)
+        
+        rotated = pygame.transform.rotate(surface, angle)
+    
+    rotated = rotated.convert_alpha()
+    return rotated, rotated.get_width() // 2, rotated.get_height() // 2
+
+def get_shape_sprite(shape, size, color, outline, rotation):
+    if shape == "circle" and not outline:
+        angle = 0  # A plain circle looks the same at every rotation
+    else:
+        angle = int(round(rotation / SHAPE_ROTATION_STEP)) * SHAPE_ROTATION_STEP % 360
+    
+    key = (shape, size, color, outline, angle)
+    entry = shape_atlas.get(key)
+    if entry is None:
+        entry = bake_shape(shape, size, color, outline, angle)
+        shape_atlas.put(key, entry)
+    return entry
+
+PARTICLE_CAPACITY = 2048
+PARTICLE_ALPHA_LEVELS = 16
+
+class ParticleEngine:
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        # Structure-of-arrays pool; live particles are always packed into [0, count)
+        if np is not None:
+            self.x = np.zeros(capacity, np.float32)
+            self.y = np.zeros(capacity, np.float32)
+            self.vx = np.zeros(capacity, np.float32)
+            self.vy = np.zeros(capacity, np.float32)
+            self.life = np.zeros(capacity, np.int16)
+            self.max_life = np.ones(capacity, np.int16)
+            self.size = np.zeros(capacity, np.int16)
+            self.color = np.zeros(capacity, np.int16)
+        else:
+            self.x = [0.0] * capacity
+            self.y = [0.0] * capacity
+            self.vx = [0.0] * capacity
+            self.vy = [0.0] * capacity
+            self.life = [0] * capacity
+            self.max_life = [1] * capacity
+            self.size = [0] * capacity
+            self.color = [0] * capacity
+        self.palette = []
+        self.palette_index = {}
+        self.stamps = {}
+        self.layer = None
+    
+    def clear(self):
+        self.count = 0
+    
+    def emit(self, x, y, vx, vy, size, life, color):
+        if self.count >= self.capacity:
+            return
+        color_index = self.palette_index.get(color)
+        if color_index is None:
+            color_index = len(self.palette)
+            self.palette.append(color)
+            self.palette_index[color] = color_index
+        
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.life[i] = life
+        self.max_life[i] = life
+        self.size[i] = size
+        self.color[i] = color_index
+        self.count += 1
+    
+    def update(self):
+        n = self.count
+        if n == 0:
+            return
+        
+        if np is not None:
+            self.x[:n] += self.vx[:n]
+            self.y[:n] += self.vy[:n]
+            self.life[:n] -= 1
+            alive = self.life[:n] > 0
+            kept = int(np.count_nonzero(alive))
+            if kept < n:
+                for values in (self.x, self.y, self.vx, self.vy, self.life, self.max_life, self.size, self.color):
+                    values[:kept] = values[:n][alive]
+            self.count = kept
+        else:
+            kept = 0
+            for i in range(n):
+                life = self.life[i] - 1
+                if life <= 0:
+                    continue
+                self.x[kept] = self.x[i] + self.vx[i]
+                self.y[kept] = self.y[i] + self.vy[i]
+                self.vx[kept] = self.vx[i]
+                self.vy[kept] = self.vy[i]
+                self.life[kept] = life
+                self.max_life[kept] = self.max_life[i]
+                self.size[kept] = self.size[i]
+                self.color[kept] = self.color[i]
+                kept += 1
+            self.count = kept
+    
+    def get_stamp(self, key):
+        stamp = self.stamps.get(key)
+        if stamp is None:
+            color_index, size, level = key
+            alpha = 255 * level // (PARTICLE_ALPHA_LEVELS - 1)
+            stamp = pygame.Surface((size * 2 + 1, size * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(stamp, (*self.palette[color_index], alpha), (size, size), size)
+            stamp = stamp.convert_alpha()
+            self.stamps[key] = stamp
+        return stamp
+    
+    def draw(self, surface):
+        n = self.count
+        if n == 0:
+            return
+        if self.layer is None or self.layer.get_size() != surface.get_size():
+            self.layer = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        
+        if np is not None:
+            size = self.size[:n].astype(np.int32)
+            left = self.x[:n].astype(np.int32) - size
+            top = self.y[:n].astype(np.int32) - size
+            level = self.life[:n].astype(np.int32) * (PARTICLE_ALPHA_LEVELS - 1) // self.max_life[:n]
+            colors = self.color[:n].tolist()
+            sizes = size.tolist()
+            levels = level.tolist()
+            lefts = left.tolist()
+            tops = top.tolist()
+        else:
+            sizes = self.size[:n]
+            colors = self.color[:n]
+            levels = [self.life[i] * (PARTICLE_ALPHA_LEVELS - 1) // self.max_life[i] for i in range(n)]
+            lefts = [int(self.x[i]) - sizes[i] for i in range(n)]
+            tops = [int(self.y[i]) - sizes[i] for i in range(n)]
+        
+        # Only the bounding box of the live particles is cleared and composited
+        bounds = pygame.Rect(min(lefts), min(tops), 0, 0)
+        bounds.width = max(lefts) + 2 * max(sizes) + 1 - bounds.x
+        bounds.height = max(tops) + 2 * max(sizes) + 1 - bounds.y
+        bounds = bounds.clip(self.layer.get_rect())
+        if bounds.width == 0 or bounds.height == 0:
+            return
+        
+        get_stamp = self.get_stamp
+        self.layer.fill((0, 0, 0, 0), bounds)
+        self.layer.blits([(get_stamp((c, r, a)), (x, y)) for c, r, a, x, y in zip(colors, sizes, levels, lefts, tops)],
+                         doreturn=False)
+        surface.blit(self.layer, bounds.topleft, bounds)
+
+particle_engine = ParticleEngine()
+
+DECORATION_SHAPES = ["square", "triangle", "circle", "star"]
 
 class Decoration:
+    __slots__ = ("x", "y", "type", "color", "size", "rotation", "rotation_speed", "prev_x", "prev_y")
+    
     def __init__(self, x, y, decoration_type, color):
+        self.reset(x, y, decoration_type, color)
+    
+    def reset(self, x, y, decoration_type, color):
         self.x = x
         self.y = y
+        # A recycled decoration must not interpolate from where its last life ended
+        self.prev_x = x
+        self.prev_y = y
         self.type = decoration_type
         self.color = color
-        self.size = random.randint(10, 30)
-        self.rotation = random.randint(0, 360)
-        self.rotation_speed = random.uniform(-1, 1)
+        self.size = visual_random.randint(10, 30)
+        self.rotation = visual_random.randint(0, 360)
+        self.rotation_speed = visual_random.uniform(-1, 1)
     
     def update(self, scroll_speed):
         self.x -= scroll_speed
         self.rotation = (self.rotation + self.rotation_speed) % 360
     
-    def draw(self):
-        if self.type == "square":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            pygame.draw.rect(surface, self.color, (0, 0, self.size, self.size))
-            pygame.draw.rect(surface, BLACK, (0, 0, self.size, self.size), 1)
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
-            
-        elif self.type == "triangle":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            pygame.draw.polygon(surface, self.color, [
-                (self.size//2, 0),
-                (0, self.size),
-                (self.size, self.size)
-            ])
-            pygame.draw.polygon(surface, BLACK, [
-                (self.size//2, 0),
-                (0, self.size),
-                (self.size, self.size)
-            ], 1)
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
-            
-        elif self.type == "circle":
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.size//2)
-            pygame.draw.circle(screen, BLACK, (int(self.x), int(self.y)), self.size//2, 1)
-            
-            angle = math.radians(self.rotation)
-            end_x = self.x + math.cos(angle) * (self.size//2)
-            end_y = self.y + math.sin(angle) * (self.size//2)
-            pygame.draw.line(screen, BLACK, (self.x, self.y), (end_x, end_y), 1)
-            
-        elif self.type == "star":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            
-            points = []
-            for i in range(5):
-                angle = math.radians(i * 72)
-                points.append((
-                    self.size//2 + math.cos(angle) * (self.size//2),
-                    self.size//2 + math.sin(angle) * (self.size//2)
-                ))
-                
-                angle = math.radians(i * 72 + 36)
-                points.append((
-                    self.size//2 + math.cos(angle) * (self.size//4),
-                    self.size//2 + math.sin(angle) * (self.size//4)
-                ))
-            
-            pygame.draw.polygon(surface, self.color, points)
-            pygame.draw.polygon(surface, BLACK, points, 1)
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
+    def draw(self, surface):
+        sprite, half_w, half_h = get_shape_sprite(self.type, self.size, self.color, True, self.rotation)
+        surface.blit(sprite, (int(self.x) - half_w, int(self.y) - half_h))
+
+class EntityPool:
+    # Free lists of retired entities so pattern generation can reuse them instead of allocating
+    def __init__(self, classes, limit=256):
+        self.limit = limit
+        self.free = {cls: [] for cls in classes}
+    
+    def acquire(self, cls, *args, **kwargs):
+        free = self.free.get(cls)
+        if free:
+            entity = free.pop()
+            entity.reset(*args, **kwargs)
+            return entity
+        return cls(*args, **kwargs)
+    
+    def release(self, entity):
+        free = self.free.get(type(entity))
+        if free is not None and len(free) < self.limit:
+            free.append(entity)
+    
+    def capture(self, entity):
+        # Slot values of an entity; the hitbox is scratch space that get_rect refills
+        cls = type(entity)
+        return cls, tuple((name, getattr(entity, name)) for name in cls.__slots__
+                          if name != "hitbox" and hasattr(entity, name))
+    
+    def revive(self, state):
+        # Rebuilds a captured entity on a free one, or a bare instance, without running reset()
+        cls, values = state
+        free = self.free.get(cls)
+        if free:
+            entity = free.pop()
+        else:
+            entity = cls.__new__(cls)
+            if "hitbox" in cls.__slots__:
+                entity.hitbox = pygame.Rect(0, 0, 0, 0)
+        for name, value in values:
+            setattr(entity, name, value)
+        return entity
+
+entity_pool = EntityPool((Obstacle, Spike, Platform, Decoration))
 
 class BackgroundElement:
     def __init__(self, bg_color):
-        self.size = random.randint(10, 30)
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(0, HEIGHT - 100)
-        self.speed = random.uniform(0.5, 2)
+        self.size = visual_random.randint(10, 30)
+        self.x = visual_random.randint(0, WIDTH)
+        self.y = visual_random.randint(0, HEIGHT - 100)
+        self.speed = visual_random.uniform(0.5, 2)
         self.color = self.get_contrasting_color(bg_color)
-        self.shape = random.choice(["circle", "square", "triangle", "star"])
-        self.rotation = random.randint(0, 360)
-        self.rotation_speed = random.uniform(-2, 2)
+        self.shape = visual_random.choice(["circle", "square", "triangle", "star"])
+        self.rotation = visual_random.randint(0, 360)
+        self.rotation_speed = visual_random.uniform(-2, 2)
     
     def get_contrasting_color(self, bg_color):
         r, g, b = bg_color
@@ -872,141 +1456,495 @@ class BackgroundElement:
         self.rotation = (self.rotation + self.rotation_speed) % 360
         if self.x + self.size < 0:
             self.x = WIDTH + self.size
-            self.y = random.randint(0, HEIGHT - 100)
-            self.size = random.randint(10, 30)
-            self.speed = random.uniform(0.5, 2)
+            self.y = visual_random.randint(0, HEIGHT - 100)
+            self.size = visual_random.randint(10, 30)
+            self.speed = visual_random.uniform(0.5, 2)
+    
+    def get_bounds(self):
+        # Large enough for the shape at any rotation
+        extent = self.size * 3 // 4 + 2
+        return pygame.Rect(int(self.x) - extent, int(self.y) - extent, extent * 2, extent * 2)
+    
+    def draw(self, surface):
+        sprite, half_w, half_h = get_shape_sprite(self.shape, self.size, self.color, False, self.rotation)
+        surface.blit(sprite, (int(self.x) - half_w, int(self.y) - half_h))
+
+def remember_position(entity):
+    entity.prev_x = entity.x
+    entity.prev_y = entity.y
+
+def draw_interpolated(entity, surface, alpha):
+    # Draw between the previous and current tick; entities spawned this tick have no previous position yet
+    x, y = entity.x, entity.y
+    prev_x = getattr(entity, "prev_x", x)
+    prev_y = getattr(entity, "prev_y", y)
+    if alpha >= 1 or abs(x - prev_x) > WIDTH // 2:
+        entity.draw(surface)
+        return
+    entity.x = prev_x + (x - prev_x) * alpha
+    entity.y = prev_y + (y - prev_y) * alpha
+    entity.draw(surface)
+    entity.x, entity.y = x, y
+
+PARALLAX_BANDS = 3
+HIGH_QUALITY_BACKGROUND = False  # Set with --hq-background: per-element rotation instead of baked layers
+
+class ParallaxBackground:
+    def __init__(self, bg_color, element_count, high_quality=None, bands=PARALLAX_BANDS):
+        self.elements = [BackgroundElement(bg_color) for _ in range(element_count)]
+        self.high_quality = HIGH_QUALITY_BACKGROUND if high_quality is None else high_quality
+        self.layers = []
+        self.top = HEIGHT
+        self.bottom = 0
+        if self.high_quality or not self.elements:
+            return
+        
+        # Group elements into speed bands; each band becomes one wrapping layer
+        band_width = 1.5 / bands  # BackgroundElement speeds are uniform(0.5, 2)
+        for band in range(bands):
+            members = [e for e in self.elements if min(bands - 1, int((e.speed - 0.5) / band_width)) == band]
+            if members:
+                self.layers.append({"speed": 0.5 + band_width * (band + 0.5), "offset": 0.0, "prev_offset": 0.0, "elements": members, "surface": None})
+        for element in self.elements:
+            extent = element.size * 3 // 4 + 2
+            self.top = min(self.top, int(element.y) - extent)
+            self.bottom = max(self.bottom, int(element.y) + extent)
+    
+    def bake_layer(self, layer):
+        color_key = (255, 0, 255) if self.elements[0].color != (255, 0, 255) else (0, 255, 0)
+        layer_surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+        layer_surface.fill(color_key)
+        layer_surface.set_colorkey(color_key, pygame.RLEACCEL)
+        
+        for element in layer["elements"]:
+            sprite, half_w, half_h = get_shape_sprite(element.shape, element.size, element.color, False, element.rotation)
+            # Shapes crossing the seam are drawn on both sides so the layer wraps seamlessly
+            for wrap in (-WIDTH, 0, WIDTH):
+                x = int(element.x) + wrap - half_w
+                if x < WIDTH and x + sprite.get_width() > 0:
+                    layer_surface.blit(sprite, (x, int(element.y) - half_h))
+        return layer_surface
+    
+    def update(self, scroll_speed):
+        if self.high_quality:
+            for element in self.elements:
+                remember_position(element)
+                element.update(scroll_speed)
+        else:
+            for layer in self.layers:
+                layer["prev_offset"] = layer["offset"]
+                layer["offset"] = (layer["offset"] + layer["speed"] * (scroll_speed / 5)) % WIDTH
+    
+    def mark_dirty(self):
+        if self.high_quality:
+            for element in self.elements:
+                renderer.mark(element.get_bounds())
+        elif self.layers:
+            renderer.mark((0, self.top, WIDTH, self.bottom - self.top))
+    
+    def capture(self):
+        if self.high_quality:
+            return [dict(vars(element)) for element in self.elements]
+        return [(layer["offset"], layer["prev_offset"]) for layer in self.layers]
+    
+    def restore(self, state):
+        if self.high_quality:
+            for element, values in zip(self.elements, state):
+                vars(element).update(values)
+        else:
+            for layer, (offset, prev_offset) in zip(self.layers, state):
+                layer["offset"] = offset
+                layer["prev_offset"] = prev_offset
+    
+    def draw(self, surface, alpha=1.0):
+        if self.high_quality:
+            for element in self.elements:
+                draw_interpolated(element, surface, alpha)
+            return
+        
+        for layer in self.layers:
+            if layer["surface"] is None:
+                layer["surface"] = self.bake_layer(layer)
+            offset = int((layer["prev_offset"] + (layer["offset"] - layer["prev_offset"]) % WIDTH * alpha) % WIDTH)
+            surface.blit(layer["surface"], (-offset, 0))
+            surface.blit(layer["surface"], (WIDTH - offset, 0))
+
+DIRTY_RECT_RENDERING = False  # Set with --dirty-rects: only push changed regions to the display
+
+class DirtyRectRenderer:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.scene = None
+        self.full = True
+        self.rects = []
+    
+    @property
+    def tracking(self):
+        return self.enabled and not self.full
+    
+    def begin(self, scene):
+        if scene != self.scene:
+            self.scene = scene
+            self.full = True
+    
+    def invalidate(self):
+        self.full = True
+    
+    def mark(self, rect):
+        if self.enabled and not self.full:
+            self.rects.append(pygame.Rect(rect))
+    
+    def needs_redraw(self):
+        return not self.enabled or self.full or len(self.rects) > 0
+    
+    def present(self):
+        if not self.enabled or self.full:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.full = False
+        self.rects = []
+
+renderer = DirtyRectRenderer(DIRTY_RECT_RENDERING)
+
+class TextLabel:
+    def __init__(self, label_font, template, color=WHITE):
+        self.font = label_font
+        self.template = template
+        self.color = color
+        self.value = None
+        self.surface = None
+    
+    def update(self, value):
+        # Only re-render when the value actually changes
+        if self.surface is None or value != self.value:
+            self.value = value
+            self.surface = self.font.render(self.template.format(value), True, self.color)
+        return self.surface
+
+class DigitFont:
+    def __init__(self, digit_font, color=WHITE):
+        self.glyphs = {}
+        for char in "0123456789-":
+            self.glyphs[char] = digit_font.render(char, True, color)
+    
+    def draw(self, surface, value, x, y):
+        for char in str(value):
+            glyph = self.glyphs[char]
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return x
+
+class NumberLabel:
+    def __init__(self, label_font, digits, prefix, color=WHITE):
+        self.prefix = label_font.render(prefix, True, color)
+        self.digits = digits
+    
+    def draw(self, surface, value, x, y):
+        surface.blit(self.prefix, (x, y))
+        return self.digits.draw(surface, value, x + self.prefix.get_width(), y)
+
+class Hud:
+    def __init__(self):
+        digits = DigitFont(font)
+        self.score = NumberLabel(font, digits, "Score: ")
+        self.high_score = NumberLabel(font, digits, "High Score: ")
+        self.lives = NumberLabel(font, digits, "Lives: ")
+        self.level = TextLabel(font, "Level: {}")
+        self.mode = TextLabel(small_font, "Mode: {}")
+        self.speed = TextLabel(small_font, "Speed: {}x")
+    
+    def draw(self, surface, score, high_score, lives, level_name, mode, speed):
+        self.score.draw(surface, score, 10, 10)
+        self.high_score.draw(surface, high_score, 10, 40)
+        self.lives.draw(surface, lives, 10, 70)
+        
+        for label, value, y in ((self.level, level_name, 10),
+                                (self.mode, MODE_NAMES[mode], 40),
+                                (self.speed, speed, 70)):
+            text = label.update(value)
+            surface.blit(text, (WIDTH - text.get_width() - 10, y))
+
+class PhaseTimer:
+    # Wall time per named phase. Laps add into the current frame until end_frame() files it;
+    # dotted names group, so "update" covers "update.player", "update.spawn" and so on
+    def __init__(self, history=None):
+        self.frames = [] if history is None else deque(maxlen=history)
+        self.current = {}
+        self.counts = {}
+        self.last_counts = {}
+        self.mark = 0.0
+    
+    def start(self):
+        self.mark = time.perf_counter()
+    
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + now - self.mark
+        self.mark = now
+    
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+    
+    def end_frame(self):
+        self.frames.append(self.current)
+        self.current = {}
+        self.last_counts = self.counts
+        self.counts = {}
+    
+    def total(self, frame, phase):
+        return sum(value for name, value in frame.items() if name == phase or name.startswith(phase + "."))
+    
+    def percentiles(self, phase, points=(50, 95, 99)):
+        # Nearest-rank percentiles in milliseconds
+        values = sorted(self.total(frame, phase) for frame in self.frames)
+        if not values:
+            return {f"p{point}": 0.0 for point in points}
+        return {f"p{point}": values[min(len(values) - 1, max(0, math.ceil(point / 100 * len(values)) - 1))] * 1000
+                for point in points}
+
+class DrawCounter:
+    # Stands in for the screen while a frame is profiled and counts the blits and fills made on it.
+    # Primitives are counted by the pygame.draw wrappers that set_draw_counting() installs
+    def __init__(self, surface):
+        self.surface = surface
+        self.calls = 0
+    
+    def __getattr__(self, name):
+        return getattr(self.surface, name)
+    
+    def blit(self, *args, **kwargs):
+        self.calls += 1
+        return self.surface.blit(*args, **kwargs)
+    
+    def blits(self, *args, **kwargs):
+        self.calls += 1
+        return self.surface.blits(*args, **kwargs)
+    
+    def fill(self, *args, **kwargs):
+        self.calls += 1
+        return self.surface.fill(*args, **kwargs)
+
+DRAW_PRIMITIVES = ("rect", "polygon", "circle", "ellipse", "arc", "line", "lines", "aaline", "aalines")
+uncounted_primitives = {name: getattr(pygame.draw, name) for name in DRAW_PRIMITIVES}
+
+def counted_primitive(primitive):
+    def draw(surface, *args, **kwargs):
+        if isinstance(surface, DrawCounter):
+            surface.calls += 1
+            surface = surface.surface
+        return primitive(surface, *args, **kwargs)
+    return draw
+
+def set_draw_counting(enabled):
+    # pygame.draw only takes real surfaces, so while the profiler runs its functions are swapped
+    # for ones that count calls made on a DrawCounter and hand the screen inside it along
+    for name, primitive in uncounted_primitives.items():
+        setattr(pygame.draw, name, counted_primitive(primitive) if enabled else primitive)
+
+PROFILE_PHASES = (
+    "update.player", "update.background", "update.decorations", "update.spawn", "update.obstacles",
+    "collision", "update.particles",
+    "draw.background", "draw.decorations", "draw.ground", "draw.obstacles", "draw.particles",
+    "draw.player", "draw.hud", "draw.profiler", "flip",
+)
+
+class ProfilerOverlay:
+    # F3 while playing: rolling per-subsystem timings, live entity counts and draw calls.
+    # With --profile-csv every played frame is also written out, overlay or not
+    def __init__(self, history=120, refresh=15):
+        self.visible = False
+        self.timer = PhaseTimer(history)
+        self.trace = None
+        self.trace_file = None
+        self.frame_number = 0
+        self.refresh = refresh  # Frames between panel rebuilds; rendering the text every frame would dominate it
+        self.panel = None
+        self.panel_frame = 0
+    
+    @property
+    def active(self):
+        return self.visible or self.trace is not None
+    
+    def toggle(self):
+        self.visible = not self.visible
+        self.panel = None
+        set_draw_counting(self.active)
+        renderer.invalidate()
+    
+    def open_trace(self, path):
+        self.trace_file = open(path, "w", newline="")
+        self.trace = csv.writer(self.trace_file)
+        self.trace.writerow(["frame"] + [f"{phase}_ms" for phase in PROFILE_PHASES] +
+                            ["obstacles", "decorations", "particles", "draw_calls"])
+        set_draw_counting(True)
+    
+    def end_frame(self, session):
+        frame = self.timer.current
+        self.timer.end_frame()
+        self.frame_number += 1
+        if self.trace is not None:
+            self.trace.writerow([self.frame_number] + [f"{frame.get(phase, 0.0) * 1000:.4f}" for phase in PROFILE_PHASES] +
+                                [len(session.obstacles), len(session.decorations), particle_engine.count,
+                                 self.timer.last_counts.get("draw calls", 0)])
+    
+    def build_panel(self, session):
+        timer = self.timer
+        totals = dict.fromkeys(PROFILE_PHASES, 0.0)
+        for frame in timer.frames:
+            for phase, value in frame.items():
+                if phase in totals:
+                    totals[phase] += value
+        frames = max(1, len(timer.frames))
+        rows = [(f"frame (avg of {len(timer.frames)})", f"{sum(totals.values()) / frames * 1000:.2f} ms")]
+        rows += [(phase, f"{totals[phase] / frames * 1000:.3f}") for phase in PROFILE_PHASES]
+        rows.append(("obstacles / decorations", f"{len(session.obstacles)} / {len(session.decorations)}"))
+        rows.append(("particles", str(particle_engine.count)))
+        rows.append(("draw calls", str(timer.last_counts.get("draw calls", 0))))
+        
+        line_height = small_font.get_linesize()
+        panel = pygame.Surface((260, line_height * len(rows) + 10), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        for i, (name, value) in enumerate(rows):
+            y = 5 + i * line_height
+            panel.blit(small_font.render(name, True, WHITE), (8, y))
+            text = small_font.render(value, True, WHITE)
+            panel.blit(text, (panel.get_width() - text.get_width() - 8, y))
+        return panel
+    
+    def draw(self, surface, session):
+        if self.panel is None or self.frame_number - self.panel_frame >= self.refresh:
+            self.panel = self.build_panel(session)
+            self.panel_frame = self.frame_number
+        surface.blit(self.panel, (10, 105))
+    
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+            self.trace = None
+            set_draw_counting(self.active)
+
+class Widget:
+    def __init__(self, x, y, width, height):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.is_hovered = False
+        self.state = None
+        self.surfaces = None
+    
+    def state_key(self):
+        return None
+    
+    def invalidate(self):
+        self.surfaces = None
+    
+    def render(self, hovered):
+        raise NotImplementedError
+    
+    def render_frame(self, color):
+        surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        local_rect = surface.get_rect()
+        pygame.draw.rect(surface, color, local_rect, border_radius=10)
+        pygame.draw.rect(surface, BLACK, local_rect, 2, border_radius=10)
+        return surface, local_rect
     
     def draw(self):
-        if self.shape == "circle":
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.size//2)
-        elif self.shape == "square":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            pygame.draw.rect(surface, self.color, (0, 0, self.size, self.size))
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
-        elif self.shape == "triangle":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            pygame.draw.polygon(surface, self.color, [
-                (self.size//2, 0),
-                (0, self.size),
-                (self.size, self.size)
-            ])
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
-        elif self.shape == "star":
-            surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            
-            points = []
-            for i in range(5):
-                angle = math.radians(i * 72)
-                points.append((
-                    self.size//2 + math.cos(angle) * (self.size//2),
-                    self.size//2 + math.sin(angle) * (self.size//2)
-                ))
-                
-                angle = math.radians(i * 72 + 36)
-                points.append((
-                    self.size//2 + math.cos(angle) * (self.size//4),
-                    self.size//2 + math.sin(angle) * (self.size//4)
-                ))
-            
-            pygame.draw.polygon(surface, self.color, points)
-            
-            rotated = pygame.transform.rotate(surface, self.rotation)
-            rect = rotated.get_rect(center=(self.x, self.y))
-            screen.blit(rotated, rect.topleft)
+        # Normal and hover surfaces are rendered once and rebuilt only when the widget's state changes
+        state = self.state_key()
+        if self.surfaces is None or state != self.state:
+            self.state = state
+            self.surfaces = (self.render(False).convert_alpha(), self.render(True).convert_alpha())
+            renderer.mark(self.rect)
+        screen.blit(self.surfaces[1 if self.is_hovered else 0], self.rect)
+    
+    def check_hover(self, pos):
+        hovered = self.rect.collidepoint(pos)
+        if hovered != self.is_hovered:
+            renderer.mark(self.rect)
+        self.is_hovered = hovered
 
-class Button:
+class Button(Widget):
     def __init__(self, x, y, width, height, text, color=BLUE, hover_color=CYAN):
-        self.rect = pygame.Rect(x, y, width, height)
+        super().__init__(x, y, width, height)
         self.text = text
         self.color = color
         self.hover_color = hover_color
-        self.is_hovered = False
     
-    def draw(self):
-        color = self.hover_color if self.is_hovered else self.color
-        pygame.draw.rect(screen, color, self.rect, border_radius=10)
-        pygame.draw.rect(screen, BLACK, self.rect, 2, border_radius=10)
+    def render(self, hovered):
+        surface, local_rect = self.render_frame(self.hover_color if hovered else self.color)
         
         text_surf = menu_font.render(self.text, True, WHITE)
-        text_rect = text_surf.get_rect(center=self.rect.center)
-        screen.blit(text_surf, text_rect)
-    
-    def check_hover(self, pos):
-        self.is_hovered = self.rect.collidepoint(pos)
+        text_rect = text_surf.get_rect(center=local_rect.center)
+        surface.blit(text_surf, text_rect)
+        return surface
     
     def is_clicked(self, pos, click):
         return self.rect.collidepoint(pos) and click
 
-class LevelButton:
+class LevelButton(Widget):
     def __init__(self, x, y, width, height, level_index, level_data):
-        self.rect = pygame.Rect(x, y, width, height)
+        super().__init__(x, y, width, height)
         self.level_index = level_index
         self.level_data = level_data
-        self.is_hovered = False
-        self.locked = level_index > 0 and high_scores[level_index-1] < 10  # Easier to unlock (10 instead of 15)
+        self.locked = level_index > 0 and run_history.best_score(level_index-1) < 10  # Easier to unlock (10 instead of 15)
     
-    def draw(self):
+    def state_key(self):
+        return self.locked, run_history.best_score(self.level_index)
+    
+    def render(self, hovered):
         if self.locked:
             color = (100, 100, 100)
         else:
-            color = self.level_data["player_color"] if self.is_hovered else (100, 100, 200)
+            color = self.level_data["player_color"] if hovered else (100, 100, 200)
         
-        pygame.draw.rect(screen, color, self.rect, border_radius=10)
-        pygame.draw.rect(screen, BLACK, self.rect, 2, border_radius=10)
+        surface, local_rect = self.render_frame(color)
         
         name_surf = menu_font.render(self.level_data["name"], True, WHITE)
-        name_rect = name_surf.get_rect(center=(self.rect.centerx, self.rect.centery - 25))
-        screen.blit(name_surf, name_rect)
+        name_rect = name_surf.get_rect(center=(local_rect.centerx, local_rect.centery - 25))
+        surface.blit(name_surf, name_rect)
         
         desc_surf = small_font.render(self.level_data["description"], True, WHITE)
-        desc_rect = desc_surf.get_rect(center=(self.rect.centerx, self.rect.centery))
-        screen.blit(desc_surf, desc_rect)
+        desc_rect = desc_surf.get_rect(center=(local_rect.centerx, local_rect.centery))
+        surface.blit(desc_surf, desc_rect)
         
-        score_text = f"High Score: {high_scores[self.level_index]}"
+        score_text = f"High Score: {run_history.best_score(self.level_index)}"
         score_surf = small_font.render(score_text, True, WHITE)
-        score_rect = score_surf.get_rect(center=(self.rect.centerx, self.rect.centery + 25))
-        screen.blit(score_surf, score_rect)
+        score_rect = score_surf.get_rect(center=(local_rect.centerx, local_rect.centery + 25))
+        surface.blit(score_surf, score_rect)
         
         if self.locked:
             lock_text = "🔒 Complete previous level"
             lock_surf = small_font.render(lock_text, True, WHITE)
-            lock_rect = lock_surf.get_rect(center=(self.rect.centerx, self.rect.centery + 50))
-            screen.blit(lock_surf, lock_rect)
-    
-    def check_hover(self, pos):
-        self.is_hovered = self.rect.collidepoint(pos)
+            lock_rect = lock_surf.get_rect(center=(local_rect.centerx, local_rect.centery + 50))
+            surface.blit(lock_surf, lock_rect)
+        return surface
     
     def is_clicked(self, pos, click):
         return self.rect.collidepoint(pos) and click and not self.locked
 
-class ChallengeButton:
+class ChallengeButton(Widget):
     def __init__(self, x, y, width, height, challenge):
-        self.rect = pygame.Rect(x, y, width, height)
+        super().__init__(x, y, width, height)
         self.challenge = challenge
-        self.is_hovered = False
     
-    def draw(self):
+    def state_key(self):
+        return self.challenge["completed"]
+    
+    def render(self, hovered):
         if self.challenge["completed"]:
             color = GREEN
         else:
-            color = BLUE if self.is_hovered else (100, 100, 200)
+            color = BLUE if hovered else (100, 100, 200)
         
-        pygame.draw.rect(screen, color, self.rect, border_radius=10)
-        pygame.draw.rect(screen, BLACK, self.rect, 2, border_radius=10)
+        surface, local_rect = self.render_frame(color)
         
         name_surf = font.render(self.challenge["name"], True, WHITE)
-        name_rect = name_surf.get_rect(midleft=(self.rect.x + 20, self.rect.centery - 15))
-        screen.blit(name_surf, name_rect)
+        name_rect = name_surf.get_rect(midleft=(20, local_rect.centery - 15))
+        surface.blit(name_surf, name_rect)
         
         desc_surf = small_font.render(self.challenge["description"], True, WHITE)
-        desc_rect = desc_surf.get_rect(midleft=(self.rect.x + 20, self.rect.centery + 15))
-        screen.blit(desc_surf, desc_rect)
+        desc_rect = desc_surf.get_rect(midleft=(20, local_rect.centery + 15))
+        surface.blit(desc_surf, desc_rect)
         
         if self.challenge["completed"]:
             status_text = "✓ Completed"
@@ -1016,20 +1954,14 @@ class ChallengeButton:
             status_color = WHITE
         
         status_surf = small_font.render(status_text, True, status_color)
-        status_rect = status_surf.get_rect(midright=(self.rect.right - 20, self.rect.centery))
-        screen.blit(status_surf, status_rect)
-    
-    def check_hover(self, pos):
-        self.is_hovered = self.rect.collidepoint(pos)
+        status_rect = status_surf.get_rect(midright=(local_rect.right - 20, local_rect.centery))
+        surface.blit(status_surf, status_rect)
+        return surface
 
-player = None
-ground = None
-obstacles = []
-decorations = []
-bg_elements = []
-obstacle_timer = 0
-used_game_modes = set()
-lives = 3  # Add lives system
+background = ParallaxBackground((30, 30, 60), 0)  # Shown behind the menus; replaced by the last played level's
+session = None
+hud = None
+profiler = ProfilerOverlay()
 
 main_menu_buttons = [
     Button(WIDTH//2 - 150, 200, 300, 60, "Play"),
@@ -1049,157 +1981,308 @@ challenge_buttons = [
     for i in range(len(CHALLENGES))
 ]
 
-def init_level(level_index):
-    global player, ground, obstacles, decorations, bg_elements, obstacle_timer, score, game_mode, game_speed, used_game_modes, lives
-    
+resume_button = Button(WIDTH//2 - 100, HEIGHT//2 - 30, 200, 60, "Resume")
+quit_button = Button(WIDTH//2 - 100, HEIGHT//2 + 50, 200, 60, "Quit to Menu")
+
+main_title_text = None
+subtitle_text = None
+version_text = None
+level_select_title_text = None
+challenges_title_text = None
+pause_text = None
+game_over_text = None
+new_high_score_text = None
+restart_text = None
+challenge_hint_text = None
+final_score_label = None
+game_over_high_score_label = None
+overlay = None
+
+def init_menu_texts():
+    global main_title_text, subtitle_text, version_text, level_select_title_text, challenges_title_text, pause_text
+    global game_over_text, new_high_score_text, restart_text, challenge_hint_text, final_score_label, game_over_high_score_label, overlay
+    
+    main_title_text = title_font.render("GEOMETRY DASH", True, NEON_BLUE)
+    subtitle_text = font.render("Enhanced Edition", True, NEON_PINK)
+    version_text = small_font.render("v2.0 Ultimate Edition", True, WHITE)
+    level_select_title_text = title_font.render("SELECT LEVEL", True, NEON_ORANGE)
+    challenges_title_text = title_font.render("CHALLENGES", True, NEON_GREEN)
+    pause_text = title_font.render("PAUSED", True, WHITE)
+    game_over_text = title_font.render("GAME OVER", True, RED)
+    new_high_score_text = font.render('New High Score!', True, NEON_GREEN)
+    restart_text = font.render('Press SPACE to return to level select', True, WHITE)
+    challenge_hint_text = small_font.render('Check the Challenges menu for new goals!', True, CYAN)
+    final_score_label = TextLabel(font, "Final Score: {}")
+    game_over_high_score_label = TextLabel(font, "High Score: {}")
+    
+    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+    overlay.fill((0, 0, 0, 128))
+
+PLAYER_CLASSES = (CubePlayer, ShipPlayer, BallPlayer, UfoPlayer, WavePlayer)  # Indexed by game mode
+SPEED_PORTAL_MULTIPLIERS = (0.7, 1.0, 1.3)  # Less extreme speed changes
+TRAJECTORY_TICKS = 5 * SIM_HZ  # Long enough to cross the screen at the slowest speed
+
+def trajectory(player_class, held):
+    # How far the player has risen after each tick with jump held whenever held(tick) says so,
+    # with inputs applied in the same order GameSession.step applies them
+    player = player_class()
+    continuous = hasattr(player, "release")  # Ship and wave keep climbing while jump is held
+    start = player.y
+    rises = []
+    was_held = False
+    for tick in range(TRAJECTORY_TICKS):
+        down = held(tick)
+        if down and not was_held:
+            player.jump()
+        elif was_held and not down and continuous:
+            player.release()
+        was_held = down
+        player.update(0)
+        if down and continuous:
+            player.jump()
+        rises.append(start - player.y)
+    return rises
+
+class TrajectoryProfile:
+    # One mode's reach tick by tick: the highest the hitbox can be after each tick (any input),
+    # how far it falls with none, and for each height how many ticks one jump stays that high
+    def __init__(self, player_class):
+        tapping = trajectory(player_class, lambda tick: tick % 2 == 0)
+        holding = trajectory(player_class, lambda tick: True)
+        falling = trajectory(player_class, lambda tick: False)
+        
+        self.climb = []
+        highest = 0
+        for rise in map(max, tapping, holding):
+            highest = max(highest, rise)  # A later start reaches any earlier height too
+            self.climb.append(highest)
+        self.drop = [-rise for rise in falling]
+        
+        # A single press gives a single arc, so the ticks at or above a height are consecutive
+        self.air_ticks = [0] * (int(max(holding)) + 2)
+        for rise in holding:
+            if rise >= 0:
+                self.air_ticks[int(rise)] += 1
+        for dy in range(len(self.air_ticks) - 2, -1, -1):
+            self.air_ticks[dy] += self.air_ticks[dy + 1]
+        
+        box = player_class().get_rect()
+        self.lift = HEIGHT - 50 - box.bottom  # Gap between a grounded hitbox and the ground
+        self.box_width = box.width
+        self.box_height = box.height
+        self.entry = box.centery  # Where the hitbox is centred when the player comes out of a portal
+
+class TrajectoryTable:
+    # A profile at a set of scroll speeds, looked up by horizontal distance in pixels. With several
+    # speeds every answer is the worst of them, for placements that have to work whichever speed
+    # portal the player last went through
+    def __init__(self, profile, speeds):
+        self.profile = profile
+        self.speeds = tuple(speeds)
+        self.slowest = min(self.speeds)
+        self.fastest = max(self.speeds)
+        self.box_height = profile.box_height
+        self.entry = profile.entry
+    
+    def climb_at(self, dx):
+        # Most the hitbox can have risen once the level has scrolled dx; fewest ticks at the fastest speed
+        ticks = min(int(dx // self.fastest), TRAJECTORY_TICKS)
+        return self.profile.climb[ticks - 1] if ticks else 0
+    
+    def drop_at(self, dx):
+        ticks = min(int(dx // self.fastest), TRAJECTORY_TICKS)
+        return self.profile.drop[ticks - 1] if ticks else 0
+    
+    def widest(self, top):
+        # Widest obstacle hitbox one jump from the ground gets over when its top is `top` px up,
+        # or -1 for none. Collisions are only tested on ticks, so the first airborne tick doesn't
+        # count, and the slowest speed covers the least ground
+        air_ticks = self.profile.air_ticks
+        dy = max(0, int(math.ceil(top - self.profile.lift)))
+        if dy >= len(air_ticks) or not air_ticks[dy]:
+            return -1
+        return (air_ticks[dy] - 1) * self.slowest - self.profile.box_width
+    
+    def steer(self, centre, target, dx):
+        # Target centre moved just far enough for the player to get there from `centre` within dx
+        return max(centre - self.climb_at(dx), min(centre + self.drop_at(dx), target))
+
+def build_level_reach():
+    # A table per level and mode covering every speed the level runs at: its base speed times
+    # each speed portal multiplier. The physics don't depend on the scroll speed, so each mode
+    # is only simulated once
+    profiles = [TrajectoryProfile(player_class) for player_class in PLAYER_CLASSES]
+    level_reach = []
+    for level in LEVELS:
+        multipliers = SPEED_PORTAL_MULTIPLIERS if level["has_speed_changes"] else (1.0,)
+        speeds = [level["base_scroll_speed"] * multiplier for multiplier in multipliers]
+        level_reach.append([TrajectoryTable(profile, speeds) for profile in profiles])
+    return level_reach
+
+LEVEL_REACH = build_level_reach()  # Per level, by mode
+
+def generate_obstacle_pattern(level_index, x_start, rng=random, pattern=None):
+    # Returns (x, class, args) records rather than entities; LevelTimeline decides when they spawn.
+    # Placements a player couldn't get through at the level's slowest or fastest speed are pulled
+    # back into reach using the trajectory tables
     level_data = LEVELS[level_index]
+    reach = LEVEL_REACH[level_index]
+    if pattern is None:
+        pattern = rng.choice(level_data["obstacle_patterns"])
+    obstacle_color = rng.choice(level_data["obstacle_colors"])
+    decoration_color = rng.choice(level_data["decoration_colors"])
     
-    game_mode = CUBE
-    player = CubePlayer(level_data["player_color"])
-    ground = Ground(level_data["ground_color"])
-    obstacles = []
-    decorations = []
-    bg_elements = [BackgroundElement(level_data["background_color"]) for _ in range(level_data["background_elements"])]
-    obstacle_timer = pygame.time.get_ticks()
-    score = 0
-    game_speed = 1.0
-    used_game_modes = {CUBE}
-    lives = 3  # Reset lives
-
-def generate_obstacle_pattern(level_index, x_start):
-    level_data = LEVELS[level_index]
-    pattern = random.choice(level_data["obstacle_patterns"])
-    obstacle_color = random.choice(level_data["obstacle_colors"])
-    decoration_color = random.choice(level_data["decoration_colors"])
+    records = []
     
-    new_obstacles = []
+    def place(cls, x, *args):
+        records.append((x, cls, args))
     
     if pattern == "basic_spike_row":
-        count = random.randint(1, 2)  # Fewer spikes (1-2 instead of 1-3)
+        count = rng.randint(1, 2)  # Fewer spikes (1-2 instead of 1-3)
+        # No more spikes than one jump clears; 40 apart, each hitbox 30 - 2 * inset wide
+        widest = reach[CUBE].widest(30 - Spike.hitbox_inset)
+        count = max(1, min(count, 1 + int((widest - (30 - 2 * Spike.hitbox_inset)) // 40)))
         for i in range(count):
-            new_obstacles.append(Spike(x_start + i*40, obstacle_color))  # More space between spikes (40 instead of 30)
+            place(Spike, x_start + i*40, obstacle_color)  # More space between spikes (40 instead of 30)
     
     elif pattern == "basic_block":
-        height = random.randint(30, 60)  # Lower blocks (30-60 instead of 40-80)
-        new_obstacles.append(Obstacle(x_start, height, obstacle_color))
+        height = rng.randint(30, 60)  # Lower blocks (30-60 instead of 40-80)
+        place(Obstacle, x_start, height, obstacle_color)
     
     elif pattern == "double_spike":
-        new_obstacles.append(Spike(x_start, obstacle_color))
+        place(Spike, x_start, obstacle_color)
         # 50% chance to add ceiling spike to make it easier
-        if random.random() > 0.5:
-            new_obstacles.append(Spike(x_start, obstacle_color, upside_down=True))
+        if rng.random() > 0.5:
+            place(Spike, x_start, obstacle_color, True)
     
     elif pattern == "platform_jump":
-        platform_width = random.randint(80, 150)  # Smaller platforms
-        platform_height = random.randint(30, 50)  # Lower platforms
-        platform_y = HEIGHT - 50 - platform_height - random.randint(30, 60)  # Lower height
+        platform_width = rng.randint(80, 150)  # Smaller platforms
+        platform_height = rng.randint(30, 50)  # Lower platforms
+        platform_y = HEIGHT - 50 - platform_height - rng.randint(30, 60)  # Lower height
         
-        new_obstacles.append(Platform(x_start, platform_y, platform_width, platform_height, level_data["ground_color"]))
-        new_obstacles.append(Spike(x_start + platform_width + 70, obstacle_color))  # More space after platform (70 instead of 50)
+        place(Platform, x_start, platform_y, platform_width, platform_height, level_data["ground_color"])
+        place(Spike, x_start + platform_width + 70, obstacle_color)  # More space after platform (70 instead of 50)
     
     elif pattern == "ship_tunnel":
         if level_data["has_ship_mode"]:
-            new_obstacles.append(Portal(x_start, SHIP, PURPLE))
+            place(Portal, x_start, SHIP, PURPLE)
             
-            tunnel_length = random.randint(300, 500)
-            gap_height = random.randint(150, 200)  # Wider gap (150-200 instead of 100-150)
-            gap_y = random.randint(100, HEIGHT - 200 - gap_height)
+            tunnel_length = rng.randint(300, 500)
+            gap_height = rng.randint(150, 200)  # Wider gap (150-200 instead of 100-150)
+            gap_y = rng.randint(100, HEIGHT - 200 - gap_height)
+            ship = reach[SHIP]
+            gap_y = int(ship.steer(ship.entry, gap_y + gap_height // 2, 150)) - gap_height // 2
             
-            new_obstacles.append(Platform(x_start + 150, 0, tunnel_length, gap_y, level_data["ground_color"]))  # More space after portal
-            new_obstacles.append(Platform(x_start + 150, gap_y + gap_height, tunnel_length, HEIGHT, level_data["ground_color"]))
+            place(Platform, x_start + 150, 0, tunnel_length, gap_y, level_data["ground_color"])  # More space after portal
+            place(Platform, x_start + 150, gap_y + gap_height, tunnel_length, HEIGHT, level_data["ground_color"])
             
-            new_obstacles.append(Portal(x_start + tunnel_length + 200, CUBE, BLUE))  # More space after tunnel
+            place(Portal, x_start + tunnel_length + 200, CUBE, BLUE)  # More space after tunnel
     
     elif pattern == "ship_columns":
         if level_data["has_ship_mode"]:
-            new_obstacles.append(Portal(x_start, SHIP, PURPLE))
+            place(Portal, x_start, SHIP, PURPLE)
             
-            section_length = random.randint(400, 600)
-            column_count = random.randint(2, 4)  # Fewer columns (2-4 instead of 3-6)
+            section_length = rng.randint(400, 600)
+            column_count = rng.randint(2, 4)  # Fewer columns (2-4 instead of 3-6)
             spacing = section_length / column_count
             
             for i in range(column_count):
                 column_x = x_start + 150 + i * spacing  # More space after portal
-                gap_height = random.randint(120, 160)  # Wider gap
-                gap_y = random.randint(100, HEIGHT - 200 - gap_height)
+                gap_height = rng.randint(120, 160)  # Wider gap
+                gap_y = rng.randint(100, HEIGHT - 200 - gap_height)
                 
-                new_obstacles.append(Obstacle(column_x, gap_y, obstacle_color))
-                new_obstacles.append(Obstacle(column_x, HEIGHT - 50 - (gap_y + gap_height), obstacle_color))
+                place(Obstacle, column_x, gap_y, obstacle_color)
+                place(Obstacle, column_x, HEIGHT - 50 - (gap_y + gap_height), obstacle_color)
             
-            new_obstacles.append(Portal(x_start + section_length + 200, CUBE, BLUE))  # More space after section
+            place(Portal, x_start + section_length + 200, CUBE, BLUE)  # More space after section
     
     elif pattern == "ball_platforms":
         if level_data["has_ball_mode"]:
-            new_obstacles.append(Portal(x_start, BALL, YELLOW))
+            place(Portal, x_start, BALL, YELLOW)
             
-            section_length = random.randint(400, 600)
-            platform_count = random.randint(3, 5)  # Fewer platforms (3-5 instead of 4-7)
+            section_length = rng.randint(400, 600)
+            platform_count = rng.randint(3, 5)  # Fewer platforms (3-5 instead of 4-7)
             spacing = section_length / platform_count
             
             for i in range(platform_count):
                 platform_x = x_start + 150 + i * spacing  # More space after portal
-                platform_width = random.randint(70, 120)  # Wider platforms
+                platform_width = rng.randint(70, 120)  # Wider platforms
                 
                 if i % 2 == 0:
-                    platform_y = HEIGHT - 50 - random.randint(30, 50)  # Lower platforms
+                    platform_y = HEIGHT - 50 - rng.randint(30, 50)  # Lower platforms
                     platform_height = HEIGHT - platform_y
-                    new_obstacles.append(Platform(platform_x, platform_y, platform_width, platform_height, level_data["ground_color"]))
+                    # The ball has to jump the whole slab
+                    widest = reach[BALL].widest(HEIGHT - 50 - platform_y - Platform.hitbox_inset)
+                    platform_width = max(30, min(platform_width, int(widest) + 2 * Platform.hitbox_inset))
+                    place(Platform, platform_x, platform_y, platform_width, platform_height, level_data["ground_color"])
                 else:
-                    platform_height = random.randint(30, 50)  # Lower platforms
-                    new_obstacles.append(Platform(platform_x, 0, platform_width, platform_height, level_data["ground_color"]))
+                    platform_height = rng.randint(30, 50)  # Lower platforms
+                    place(Platform, platform_x, 0, platform_width, platform_height, level_data["ground_color"])
             
-            new_obstacles.append(Portal(x_start + section_length + 200, CUBE, BLUE))  # More space after section
+            place(Portal, x_start + section_length + 200, CUBE, BLUE)  # More space after section
     
     elif pattern == "ufo_pillars":
         if level_data["has_ufo_mode"]:
-            new_obstacles.append(Portal(x_start, UFO, CYAN))
+            place(Portal, x_start, UFO, CYAN)
             
-            section_length = random.randint(400, 600)
-            pillar_count = random.randint(3, 5)  # Fewer pillars (3-5 instead of 5-8)
+            section_length = rng.randint(400, 600)
+            pillar_count = rng.randint(3, 5)  # Fewer pillars (3-5 instead of 5-8)
             spacing = section_length / pillar_count
+            ufo = reach[UFO]
+            centre = ufo.entry
             
             for i in range(pillar_count):
                 pillar_x = x_start + 150 + i * spacing  # More space after portal
-                gap_height = random.randint(120, 160)  # Wider gap
-                gap_y = random.randint(100, HEIGHT - 200 - gap_height)
+                gap_height = rng.randint(120, 160)  # Wider gap
+                gap_y = rng.randint(100, HEIGHT - 200 - gap_height)
+                centre = ufo.steer(centre, gap_y + gap_height // 2, 150 if i == 0 else spacing)
+                gap_y = int(centre) - gap_height // 2
                 
-                new_obstacles.append(Platform(pillar_x, 0, 30, gap_y, obstacle_color))
-                new_obstacles.append(Platform(pillar_x, gap_y + gap_height, 30, HEIGHT - (gap_y + gap_height), obstacle_color))
+                place(Platform, pillar_x, 0, 30, gap_y, obstacle_color)
+                place(Platform, pillar_x, gap_y + gap_height, 30, HEIGHT - (gap_y + gap_height), obstacle_color)
             
-            new_obstacles.append(Portal(x_start + section_length + 200, CUBE, BLUE))  # More space after section
+            place(Portal, x_start + section_length + 200, CUBE, BLUE)  # More space after section
     
     elif pattern == "wave_corridor":
         if level_data["has_wave_mode"]:
-            new_obstacles.append(Portal(x_start, WAVE, NEON_PINK))
+            place(Portal, x_start, WAVE, NEON_PINK)
             
-            section_length = random.randint(400, 600)
-            corridor_width = random.randint(100, 140)  # Wider corridor (100-140 instead of 60-100)
+            section_length = rng.randint(400, 600)
+            corridor_width = rng.randint(100, 140)  # Wider corridor (100-140 instead of 60-100)
             
-            segments = random.randint(3, 6)  # Fewer segments (3-6 instead of 5-10)
+            segments = rng.randint(3, 6)  # Fewer segments (3-6 instead of 5-10)
             segment_length = section_length / segments
+            wave = reach[WAVE]
+            centre = wave.entry
             
             for i in range(segments):
                 segment_x = x_start + 150 + i * segment_length  # More space after portal
                 
                 if i % 2 == 0:
-                    corridor_y = random.randint(100, HEIGHT - 250 - corridor_width)
+                    corridor_y = rng.randint(100, HEIGHT - 250 - corridor_width)
                 else:
-                    corridor_y = random.randint(150, HEIGHT - 200 - corridor_width)
+                    corridor_y = rng.randint(150, HEIGHT - 200 - corridor_width)
+                target = wave.steer(centre, corridor_y + corridor_width // 2, 150 if i == 0 else segment_length)
+                if i:
+                    # Neighbouring segments have to overlap by enough for the wave to pass the join
+                    overlap = corridor_width - wave.box_height
+                    target = max(centre - overlap, min(centre + overlap, target))
+                centre = target
+                corridor_y = int(centre) - corridor_width // 2
                 
-                new_obstacles.append(Platform(segment_x, 0, segment_length, corridor_y, obstacle_color))
-                new_obstacles.append(Platform(segment_x, corridor_y + corridor_width, segment_length, HEIGHT - (corridor_y + corridor_width), obstacle_color))
+                place(Platform, segment_x, 0, segment_length, corridor_y, obstacle_color)
+                place(Platform, segment_x, corridor_y + corridor_width, segment_length, HEIGHT - (corridor_y + corridor_width), obstacle_color)
             
-            new_obstacles.append(Portal(x_start + section_length + 200, CUBE, BLUE))  # More space after section
+            place(Portal, x_start + section_length + 200, CUBE, BLUE)  # More space after section
     
-    for _ in range(random.randint(3, 8)):
-        decoration_x = x_start + random.randint(0, 300)
-        decoration_y = random.randint(50, HEIGHT - 100)
-        decoration_type = random.choice(["square", "triangle", "circle", "star"])
-        decorations.append(Decoration(decoration_x, decoration_y, decoration_type, decoration_color))
+    for _ in range(rng.randint(3, 8)):
+        decoration_x = x_start + rng.randint(0, 300)
+        decoration_y = rng.randint(50, HEIGHT - 100)
+        decoration_type = rng.choice(DECORATION_SHAPES)
+        place(Decoration, decoration_x, decoration_y, decoration_type, decoration_color)
     
-    if level_data["has_speed_changes"] and random.random() < 0.2:  # Less frequent speed changes (0.2 instead of 0.3)
-        speed_options = [0.7, 1.0, 1.3]  # Less extreme speed changes
-        speed_multiplier = random.choice(speed_options)
+    if level_data["has_speed_changes"] and rng.random() < 0.2:  # Less frequent speed changes (0.2 instead of 0.3)
+        speed_multiplier = rng.choice(SPEED_PORTAL_MULTIPLIERS)
         
         if speed_multiplier == 0.7:
             color = (0, 255, 0)
@@ -1208,221 +2291,845 @@ def generate_obstacle_pattern(level_index, x_start):
         else:
             color = (255, 0, 0)
         
-        new_obstacles.append(SpeedPortal(x_start - 150, speed_multiplier, color))  # More space before speed portal
+        place(SpeedPortal, x_start - 150, speed_multiplier, color)  # More space before speed portal
     
-    return new_obstacles
+    return records
 
-def change_game_mode(new_mode, player_color):
-    global player, game_mode, used_game_modes
-    
-    game_mode = new_mode
-    used_game_modes.add(new_mode)
-    
-    if new_mode == CUBE:
-        player = CubePlayer(player_color)
-    elif new_mode == SHIP:
-        player = ShipPlayer(player_color)
-    elif new_mode == BALL:
-        player = BallPlayer(player_color)
-    elif new_mode == UFO:
-        player = UfoPlayer(player_color)
-    elif new_mode == WAVE:
-        player = WavePlayer(player_color)
-    
-    player.make_invincible(60)  # Give invincibility after mode change
+class LevelTimeline:
+    # A level compiled into chunks of (x, class, args) records in world coordinates, ordered by x.
+    # Chunks are compiled one at a time as the camera nears them and dropped once spawned
+    def __init__(self, level_index, seed=None, level_file=None):
+        self.level_index = level_index
+        self.level_data = LEVELS[level_index] if level_file is None else level_file.level_data
+        self.level_file = level_file  # Authored levels read their chunks from here instead of generating them
+        self.file_chunk = 0
+        self.rng = random.Random(random.getrandbits(32) if seed is None else seed)
+        self.layout = deque(self.level_data.get("layout", ()))  # Authored pattern names, played before the random ones
+        self.frequency = self.level_data["obstacle_frequency"]
+        self.end_x = WIDTH
+        self.chunks = deque()
+        self.patterns = []  # (start x, name) of every generated chunk, for reporting where a run ended
+    
+    def compile_chunk(self):
+        if self.level_file is not None:
+            if self.file_chunk >= self.level_file.chunk_count:
+                return False
+            self.chunks.append(self.level_file.read_chunk(self.file_chunk))
+            self.file_chunk += 1
+            return True
+        
+        # The old timer fired every `frequency` ms; at any game speed that is the same distance
+        self.end_x += self.frequency / 1000 * SIM_HZ * self.level_data["base_scroll_speed"]
+        self.frequency = max(1200, self.frequency - 5)  # Slower difficulty increase
+        
+        pattern = self.layout.popleft() if self.layout else self.rng.choice(self.level_data["obstacle_patterns"])
+        self.patterns.append((self.end_x, pattern))
+        records = generate_obstacle_pattern(self.level_index, self.end_x, self.rng, pattern)
+        records.sort(key=lambda record: record[0])
+        self.chunks.append((self.end_x, records))
+        return True
+    
+    def next_start(self):
+        if not self.chunks and not self.compile_chunk():
+            return math.inf  # The authored level has run out
+        return self.chunks[0][0]
+    
+    def take(self, horizon):
+        # Hands over every chunk that starts at or before the horizon
+        records = []
+        while self.next_start() <= horizon:
+            records.extend(self.chunks.popleft()[1])
+        return records
+    
+    def patterns_at(self, x):
+        # Names of the generated pattern that world x falls in and of the one before it
+        for i in range(len(self.patterns) - 1, -1, -1):
+            if self.patterns[i][0] <= x:
+                return self.patterns[i - 1][1] if i else None, self.patterns[i][1]
+        return None, None
+    
+    def capture(self):
+        # Compiled record lists are never modified, so the chunks can be shared
+        return (self.rng.getstate(), tuple(self.layout), self.frequency, self.end_x,
+                self.file_chunk, tuple(self.chunks), len(self.patterns))
+    
+    def restore(self, state):
+        rng_state, layout, self.frequency, self.end_x, self.file_chunk, chunks, pattern_count = state
+        self.rng.setstate(rng_state)
+        self.layout = deque(layout)
+        self.chunks = deque(chunks)
+        del self.patterns[pattern_count:]
 
-def check_challenges():
-    for i in range(3):
-        if score >= CHALLENGES[i]["requirement"] and not CHALLENGES[i]["completed"]:
-            CHALLENGES[i]["completed"] = True
-            save_game_data()
-    
-    if all(high_scores[i] >= 10 for i in range(len(LEVELS))) and not CHALLENGES[3]["completed"]:  # Easier requirement (10 instead of 15)
-        CHALLENGES[3]["completed"] = True
-        save_game_data()
-    
-    if score >= CHALLENGES[4]["requirement"] and (game_mode != CUBE or player.jump_count <= 20) and not CHALLENGES[4]["completed"]:
-        CHALLENGES[4]["completed"] = True
-        save_game_data()
-    
-    if len(used_game_modes) >= 5 and not CHALLENGES[5]["completed"]:
-        CHALLENGES[5]["completed"] = True
-        save_game_data()
+LEVEL_FILE_MAGIC = b"GDLV"
+LEVEL_FILE_VERSION = 1
+LEVEL_FILE_HEADER = struct.Struct("<4sHHIIQ")  # magic, version, reserved, chunks, records, metadata bytes
+LEVEL_FILE_CHUNK = struct.Struct("<dII")  # start x, first record, record count
+LEVEL_FILE_RECORD = struct.Struct("<BBBxdffff")  # kind, color index, flags, x, y, w, h, param
+LEVEL_FILE_KINDS = (Obstacle, Spike, Platform, Portal, SpeedPortal, Decoration)
+# Which record field each constructor argument after x is stored in; fields a class derives itself stay zero
+LEVEL_FILE_LAYOUTS = {
+    Obstacle: ("h", "color"),
+    Spike: ("color", "upside_down"),
+    Platform: ("y", "w", "h", "color"),
+    Portal: ("mode", "color"),
+    SpeedPortal: ("speed", "color"),
+    Decoration: ("y", "shape", "color"),
+}
 
-load_game_data()
+def encode_level_record(record, palette):
+    x, cls, args = record
+    fields = {"y": 0, "w": 0, "h": 0, "param": 0, "flags": 0, "color": 0}
+    for name, value in zip(LEVEL_FILE_LAYOUTS[cls], args):
+        if name == "color":
+            fields["color"] = palette.setdefault(value, len(palette))
+        elif name == "upside_down":
+            fields["flags"] = int(value)
+        elif name == "shape":
+            fields["param"] = DECORATION_SHAPES.index(value)
+        elif name in ("mode", "speed"):
+            fields["param"] = value
+        else:
+            fields[name] = value
+    return LEVEL_FILE_RECORD.pack(LEVEL_FILE_KINDS.index(cls), fields["color"], fields["flags"], x,
+                                  fields["y"], fields["w"], fields["h"], fields["param"])
 
-running = True
-mouse_clicked = False
-key_pressed = False
+def decode_level_record(fields, palette):
+    kind, color, flags, x, y, w, h, param = fields
+    cls = LEVEL_FILE_KINDS[kind]
+    args = []
+    for name in LEVEL_FILE_LAYOUTS[cls]:
+        if name == "color":
+            args.append(palette[color])
+        elif name == "upside_down":
+            args.append(bool(flags))
+        elif name == "shape":
+            args.append(DECORATION_SHAPES[int(param)])
+        elif name == "mode":
+            args.append(int(param))
+        elif name == "speed":
+            args.append(round(param, 3))  # Undo float32 noise so 0.7 stays 0.7
+        else:
+            args.append({"y": y, "w": w, "h": h}[name])
+    return x, cls, tuple(args)
 
-while running:
-    mouse_pos = pygame.mouse.get_pos()
-    mouse_clicked = False
+def level_data_from_json(metadata):
+    # JSON turns color tuples into lists; colors are used as cache keys, so turn them back
+    level_data = dict(metadata)
+    for key, value in metadata.items():
+        if key.endswith("_color"):
+            level_data[key] = tuple(value)
+        elif key.endswith("_colors"):
+            level_data[key] = [tuple(color) for color in value]
+    return level_data
+
+def write_level_file(path, level_data, chunks):
+    palette = {}
+    index = []
+    records = []
+    for start_x, chunk in chunks:
+        index.append(LEVEL_FILE_CHUNK.pack(start_x, len(records), len(chunk)))
+        records.extend(encode_level_record(record, palette) for record in chunk)
+    
+    metadata = json.dumps(dict(level_data, palette=list(palette))).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(LEVEL_FILE_HEADER.pack(LEVEL_FILE_MAGIC, LEVEL_FILE_VERSION, 0, len(index), len(records), len(metadata)))
+        f.write(metadata)
+        f.write(b"".join(index))
+        f.write(b"".join(records))
+    return len(index), len(records)
+
+def export_level(path, level_index, chunk_count, seed=None):
+    timeline = LevelTimeline(level_index, seed)
     
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                key_pressed = True
-                if game_state == PLAYING:
-                    player.jump()
-                elif game_state == GAME_OVER:
-                    game_state = LEVEL_SELECT
-                elif game_state == PAUSE:
-                    game_state = PLAYING
-            
-            if event.key == pygame.K_ESCAPE:
-                if game_state == PLAYING:
-                    game_state = PAUSE
-                elif game_state == PAUSE:
-                    game_state = PLAYING
-                elif game_state in [LEVEL_SELECT, CHALLENGES]:
-                    game_state = MAIN_MENU
-                elif game_state == MAIN_MENU:
-                    running = False
-        
-        if event.type == pygame.KEYUP:
-            if event.key == pygame.K_SPACE:
-                key_pressed = False
-                if game_state == PLAYING and game_mode in [SHIP, WAVE]:
-                    player.release()
-        
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            mouse_clicked = True
+    def chunks():
+        for _ in range(chunk_count):
+            timeline.compile_chunk()
+            yield timeline.chunks.popleft()
     
-    if game_state == MAIN_MENU:
-        for i, button in enumerate(main_menu_buttons):
-            button.check_hover(mouse_pos)
-            if button.is_clicked(mouse_pos, mouse_clicked):
-                if i == 0:
-                    game_state = LEVEL_SELECT
-                elif i == 1:
-                    game_state = CHALLENGES
-                elif i == 2:
-                    running = False
+    return write_level_file(path, LEVELS[level_index], chunks())
+
+class LevelFile:
+    # A level written by write_level_file. The file is memory-mapped and a chunk's records are
+    # only decoded when the timeline asks for it, so huge levels open without reading them
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is empty") from None
+        try:
+            self.parse()
+        except (struct.error, ValueError, KeyError, TypeError):
+            # Anything malformed surfaces as one error here, never as a crash halfway through the level
+            self.data.close()
+            raise ValueError(f"{path} is not a valid version {LEVEL_FILE_VERSION} level file") from None
+    
+    def parse(self):
+        magic, version, _, self.chunk_count, self.record_count, metadata_size = LEVEL_FILE_HEADER.unpack_from(self.data, 0)
+        if magic != LEVEL_FILE_MAGIC or version != LEVEL_FILE_VERSION:
+            raise ValueError("bad header")
+        
+        offset = LEVEL_FILE_HEADER.size
+        metadata = json.loads(self.data[offset:offset + metadata_size].decode("utf-8"))
+        self.palette = [tuple(color) for color in metadata.pop("palette")]
+        self.level_data = level_data_from_json(metadata)
+        self.index_offset = offset + metadata_size
+        self.records_offset = self.index_offset + self.chunk_count * LEVEL_FILE_CHUNK.size
+        if len(self.data) < self.records_offset + self.record_count * LEVEL_FILE_RECORD.size:
+            raise ValueError("truncated")
+        # The index is small; checking it up front means read_chunk never runs off the end
+        for _, first, count in LEVEL_FILE_CHUNK.iter_unpack(self.data[self.index_offset:self.records_offset]):
+            if first + count > self.record_count:
+                raise ValueError("chunk out of range")
+    
+    def read_chunk(self, chunk):
+        start_x, first, count = LEVEL_FILE_CHUNK.unpack_from(self.data, self.index_offset + chunk * LEVEL_FILE_CHUNK.size)
+        offset = self.records_offset + first * LEVEL_FILE_RECORD.size
+        records = []
+        for i in range(count):
+            fields = LEVEL_FILE_RECORD.unpack_from(self.data, offset + i * LEVEL_FILE_RECORD.size)
+            records.append(decode_level_record(fields, self.palette))
+        return start_x, records
     
-    elif game_state == LEVEL_SELECT:
-        for i, button in enumerate(level_buttons):
-            button.locked = i > 0 and high_scores[i-1] < 10  # Easier to unlock levels
-            button.check_hover(mouse_pos)
-            if button.is_clicked(mouse_pos, mouse_clicked):
-                current_level = i
-                init_level(current_level)
-                game_state = PLAYING
+    def close(self):
+        self.data.close()
+
+def open_level_file(path):
+    try:
+        return LevelFile(path)
+    except (OSError, ValueError) as error:
+        print(f"Error loading level file: {error}")
+        return None
+
+OBSTACLE_VECTOR_ROWS = 640  # Rows at which numpy columns start to beat lists with early exits
+
+class ObstacleStore:
+    # Structure-of-arrays view of the live obstacles, ordered by left edge. Positions, hitboxes
+    # and flags live in the columns; the objects are only brought up to date by sync() for drawing.
+    # Real levels keep 4-13 rows live, where each numpy call costs more than scanning the few rows
+    # in front of the player, so the columns are plain lists until a store gets very large
+    COLUMNS = (
+        ("x", float),
+        ("prev_x", float),
+        ("width", float),
+        ("inset", int),
+        ("top", int),
+        ("box_width", int),
+        ("box_height", int),
+        ("kind", int),
+        ("passed", bool),
+    )
+    
+    def __init__(self):
+        self.objects = []
+        self.animated = []
+        self.vector = False  # Whether the columns are numpy arrays
+        for name, _ in self.COLUMNS:
+            setattr(self, name, [])
+    
+    def __iter__(self):
+        return iter(self.objects)
+    
+    def __len__(self):
+        return len(self.objects)
+    
+    def convert(self, vector):
+        # Switches the columns between lists and arrays; the values are the same either way
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, np.array(column, dtype) if vector else column.tolist())
+        self.vector = vector
+    
+    def insert(self, new_obstacles):
+        if not new_obstacles:
+            return
+        if not self.vector and np is not None and len(self.objects) + len(new_obstacles) >= OBSTACLE_VECTOR_ROWS:
+            self.convert(True)
+        # Hitboxes are truncated to ints the same way pygame.Rect does it
+        rows = [(o.x, o.x, o.width, o.hitbox_inset, int(o.y + o.hitbox_inset),
+                 int(o.width - 2 * o.hitbox_inset), int(o.height - 2 * o.hitbox_inset),
+                 o.kind, o.passed) for o in new_obstacles]
+        for (name, dtype), values in zip(self.COLUMNS, zip(*rows)):
+            column = getattr(self, name)
+            if self.vector:
+                setattr(self, name, np.concatenate((column, np.array(values, dtype))))
+            else:
+                column.extend(values)
+        self.objects.extend(new_obstacles)
+        
+        # Everything scrolls at the same speed, so one stable sort per spawn keeps the order
+        if self.vector:
+            self.select(np.argsort(self.x, kind="stable"))
+        else:
+            self.select(sorted(range(len(self.objects)), key=self.x.__getitem__))
+    
+    def select(self, rows):
+        self.objects = [self.objects[i] for i in rows]
+        for name, _ in self.COLUMNS:
+            column = getattr(self, name)
+            if self.vector:
+                setattr(self, name, column[rows])
+            else:
+                setattr(self, name, [column[i] for i in rows])
+        self.animated = [i for i, obstacle in enumerate(self.objects) if obstacle.animated]
+    
+    def scroll(self, scroll_speed):
+        if self.vector:
+            self.prev_x[:] = self.x
+            self.x -= scroll_speed
+        else:
+            self.prev_x = self.x
+            self.x = [x - scroll_speed for x in self.x]
+        
+        for i in self.animated:
+            self.objects[i].animate(float(self.x[i]))
+    
+    def pass_behind(self, player_x):
+        # Marks and returns the rows whose right edge just went behind the player
+        if self.vector:
+            rows = np.flatnonzero(~self.passed & (self.x + self.width < player_x))
+            self.passed[rows] = True
+            return rows.tolist()
+        
+        rows = []
+        for i, x in enumerate(self.x):
+            if x >= player_x:
+                break
+            if not self.passed[i] and x + self.width[i] < player_x:
+                self.passed[i] = True
+                rows.append(i)
+        return rows
+    
+    def overlapping(self, rect):
+        # Rows whose hitbox overlaps rect, with the same edge rules as Rect.colliderect
+        if self.vector:
+            left = np.trunc(self.x + self.inset)
+            hits = ((left < rect.right) & (left + self.box_width > rect.left) &
+                    (self.top < rect.bottom) & (self.top + self.box_height > rect.top))
+            return np.flatnonzero(hits).tolist()
+        
+        rows = []
+        for i, x in enumerate(self.x):
+            if x >= rect.right:
+                break
+            left = int(x + self.inset[i])
+            if (left < rect.right and left + self.box_width[i] > rect.left and
+                    self.top[i] < rect.bottom and self.top[i] + self.box_height[i] > rect.top):
+                rows.append(i)
+        return rows
+    
+    def retire_offscreen(self):
+        if self.vector:
+            gone = self.x + self.width < 0
+            if gone.any():
+                for i in np.flatnonzero(gone).tolist():
+                    entity_pool.release(self.objects[i])
+                self.select(np.flatnonzero(~gone))
+                if len(self.objects) < OBSTACLE_VECTOR_ROWS // 2:  # Half, so a store near the line doesn't flip every spawn
+                    self.convert(False)
+            return
+        
+        # Anything fully off the left edge starts left of x=0, so only that prefix is scanned
+        count = 0
+        while count < len(self.x) and self.x[count] < 0:
+            count += 1
+        keep = []
+        for i in range(count):
+            if self.x[i] + self.width[i] >= 0:
+                keep.append(i)
+            else:
+                entity_pool.release(self.objects[i])
+        if len(keep) < count:
+            self.select(keep + list(range(count, len(self.x))))
+    
+    def capture(self):
+        columns = tuple(getattr(self, name).copy() for name, _ in self.COLUMNS)
+        return columns, [entity_pool.capture(obstacle) for obstacle in self.objects]
+    
+    def restore(self, state):
+        columns, objects = state
+        for obstacle in self.objects:
+            entity_pool.release(obstacle)
+        # Copied again so the same snapshot can be restored any number of times
+        for (name, _), column in zip(self.COLUMNS, columns):
+            setattr(self, name, column.copy())
+        self.vector = not isinstance(columns[0], list)
+        self.objects = [entity_pool.revive(obstacle) for obstacle in objects]
+        self.animated = [i for i, obstacle in enumerate(self.objects) if obstacle.animated]
+    
+    def sync(self):
+        xs = self.x.tolist() if self.vector else self.x
+        prev_xs = self.prev_x.tolist() if self.vector else self.prev_x
+        for obstacle, x, prev_x in zip(self.objects, xs, prev_xs):
+            obstacle.x = x
+            obstacle.prev_x = prev_x
+
+JUMP_PRESS = "press"
+JUMP_RELEASE = "release"
+
+REPLAY_FILE = "geometry_dash_replay.gdr"  # The last finished run, for --replay
+REPLAY_FILE_MAGIC = b"GDRP"
+REPLAY_FILE_VERSION = 1
+REPLAY_FILE_HEADER = struct.Struct("<4sHHqII")  # magic, version, level, seed, ticks, edges
+
+class Replay:
+    # A run kept as its seed and the ticks the jump key went down or up. Feeding the edges to
+    # a fresh session with the same seed plays the run again exactly
+    def __init__(self, level_index, seed, edges=None, ticks=0):
+        self.level_index = level_index
+        self.seed = seed
+        self.edges = [] if edges is None else edges  # (tick, action), oldest first
+        self.ticks = ticks
+    
+    def record(self, tick, inputs):
+        for action in inputs:
+            self.edges.append((tick, action))
+    
+    def truncate(self, tick):
+        # A rewound run continues from `tick`, so the edges after it never happened
+        edges = self.edges
+        while edges and edges[-1][0] >= tick:
+            edges.pop()
+    
+    def policy(self):
+        by_tick = {}
+        for tick, action in self.edges:
+            by_tick.setdefault(tick, []).append(action)
+        
+        def policy(session):
+            return by_tick.get(session.ticks, ())
+        return policy
+
+def write_replay(path, replay):
+    # Each edge is a varint of the ticks since the previous edge, shifted left by one, with the
+    # low bit set for a release; a few bytes per jump
+    body = bytearray()
+    last = 0
+    for tick, action in replay.edges:
+        value = (tick - last) << 1 | (action == JUMP_RELEASE)
+        last = tick
+        while value >= 0x80:
+            body.append(value & 0x7F | 0x80)
+            value >>= 7
+        body.append(value)
+    
+    with open(path, "wb") as f:
+        f.write(REPLAY_FILE_HEADER.pack(REPLAY_FILE_MAGIC, REPLAY_FILE_VERSION, replay.level_index,
+                                        replay.seed, replay.ticks, len(replay.edges)))
+        f.write(body)
+
+def read_replay(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, level_index, seed, ticks, edge_count = REPLAY_FILE_HEADER.unpack_from(data, 0)
+    if magic != REPLAY_FILE_MAGIC or version != REPLAY_FILE_VERSION:
+        raise ValueError(f"{path} is not a version {REPLAY_FILE_VERSION} replay file")
+    
+    edges = []
+    tick = 0
+    offset = REPLAY_FILE_HEADER.size
+    for _ in range(edge_count):
+        value = shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        tick += value >> 1
+        edges.append((tick, JUMP_RELEASE if value & 1 else JUMP_PRESS))
+    return Replay(level_index, seed, edges, ticks)
+
+def open_replay(path):
+    try:
+        replay = read_replay(path)
+    except (struct.error, IndexError):
+        print(f"Error loading replay: {path} is truncated")
+        return None
+    except (OSError, ValueError) as error:
+        print(f"Error loading replay: {error}")
+        return None
+    if replay.level_index not in range(len(LEVELS)):
+        print(f"Error loading replay: {path} is for level {replay.level_index}, which doesn't exist")
+        return None
+    return replay
+
+class GameSession:
+    def __init__(self, level_index, record_progress=True, seed=None, level_file=None):
+        level_data = LEVELS[level_index] if level_file is None else level_file.level_data
+        if seed is None:
+            seed = random.getrandbits(32)
         
-        back_button.check_hover(mouse_pos)
-        if back_button.is_clicked(mouse_pos, mouse_clicked):
-            game_state = MAIN_MENU
-    
-    elif game_state == CHALLENGES:
-        for button in challenge_buttons:
-            button.check_hover(mouse_pos)
+        self.level_index = level_index
+        self.level_data = level_data
+        self.seed = seed
+        # Authored levels aren't regenerated from the seed, so only generated ones are replayable
+        self.replay = Replay(level_index, seed) if level_file is None else None
+        visual_random.seed(f"visual {seed}")  # Before the background draws its elements
+        # False for bots, batch runs and level files: never touch high scores or the save file
+        self.record_progress = record_progress and level_file is None
+        self.game_mode = CUBE
+        self.player = CubePlayer(level_data["player_color"])
+        self.ground = Ground(level_data["ground_color"])
+        self.obstacles = ObstacleStore()
+        self.decorations = []
+        self.background = ParallaxBackground(level_data["background_color"], level_data["background_elements"])
+        self.timeline = LevelTimeline(level_index, seed, level_file)
+        self.distance = 0  # World x of the left screen edge
+        self.spawn_distance = self.timeline.next_start() - WIDTH
+        self.sim_time = 0  # Milliseconds of simulated gameplay
+        self.ticks = 0
+        self.score = 0
+        self.game_speed = 1.0
+        self.used_game_modes = {CUBE}
+        self.jumps = 0
+        self.timer = None  # A PhaseTimer to report update and collision time into
+        self.lives = 3
+        self.jump_held = False
+        self.over = False
+        self.mode_pinned = False  # Benchmarks hold one mode for the whole run and fly through portals
+        particle_engine.clear()
+    
+    def spawn_chunks(self):
+        new_obstacles = []
+        for x, cls, args in self.timeline.take(self.distance + WIDTH):
+            entity = entity_pool.acquire(cls, x - self.distance, *args)
+            if cls is Decoration:
+                self.decorations.append(entity)
+            else:
+                new_obstacles.append(entity)
+        self.obstacles.insert(new_obstacles)
+        self.spawn_distance = self.timeline.next_start() - WIDTH
+    
+    def snapshot(self):
+        # Everything step() reads or writes, without surfaces or particles. Entities are kept as
+        # slot values rather than references because the pool recycles them once they retire
+        player = self.player
+        player_state = {name: list(value) if isinstance(value, list) else value
+                        for name, value in vars(player).items() if name != "hitbox"}
+        return {
+            "ticks": self.ticks,
+            "sim_time": self.sim_time,
+            "distance": self.distance,
+            "spawn_distance": self.spawn_distance,
+            "score": self.score,
+            "game_speed": self.game_speed,
+            "game_mode": self.game_mode,
+            "used_game_modes": frozenset(self.used_game_modes),
+            "lives": self.lives,
+            "jumps": self.jumps,
+            "jump_held": self.jump_held,
+            "over": self.over,
+            "player": (type(player), player_state),
+            "obstacles": self.obstacles.capture(),
+            "decorations": [entity_pool.capture(decoration) for decoration in self.decorations],
+            "timeline": self.timeline.capture(),
+            "ground": (self.ground.offset, self.ground.prev_offset),
+            "background": self.background.capture(),
+            "visual_random": visual_random.getstate(),
+        }
+    
+    def restore(self, snapshot):
+        self.ticks = snapshot["ticks"]
+        self.sim_time = snapshot["sim_time"]
+        self.distance = snapshot["distance"]
+        self.spawn_distance = snapshot["spawn_distance"]
+        self.score = snapshot["score"]
+        self.game_speed = snapshot["game_speed"]
+        self.game_mode = snapshot["game_mode"]
+        self.used_game_modes = set(snapshot["used_game_modes"])
+        self.lives = snapshot["lives"]
+        self.jumps = snapshot["jumps"]
+        self.jump_held = snapshot["jump_held"]
+        self.over = snapshot["over"]
+        
+        player_class, player_state = snapshot["player"]
+        if type(self.player) is not player_class:
+            self.player = player_class(self.level_data["player_color"])
+        for name, value in player_state.items():
+            setattr(self.player, name, list(value) if isinstance(value, list) else value)
+        
+        self.obstacles.restore(snapshot["obstacles"])
+        for decoration in self.decorations:
+            entity_pool.release(decoration)
+        self.decorations = [entity_pool.revive(decoration) for decoration in snapshot["decorations"]]
+        self.timeline.restore(snapshot["timeline"])
+        self.ground.offset, self.ground.prev_offset = snapshot["ground"]
+        self.background.restore(snapshot["background"])
+        visual_random.setstate(snapshot["visual_random"])
+        particle_engine.clear()
+        if self.replay is not None:
+            self.replay.truncate(self.ticks)
+    
+    def best_score(self):
+        return run_history.best_score(self.level_index) if self.record_progress else self.score
+    
+    def close(self):
+        # Kept open until the session is replaced: rewinding after a game over still reads chunks
+        if self.timeline.level_file is not None:
+            self.timeline.level_file.close()
+    
+    def emit(self, event):
+        if self.record_progress:
+            challenge_engine.emit(event, self)
+    
+    def change_game_mode(self, new_mode):
+        player_color = self.level_data["player_color"]
+        self.game_mode = new_mode
+        self.used_game_modes.add(new_mode)
+        
+        if new_mode == CUBE:
+            self.player = CubePlayer(player_color)
+        elif new_mode == SHIP:
+            self.player = ShipPlayer(player_color)
+        elif new_mode == BALL:
+            self.player = BallPlayer(player_color)
+        elif new_mode == UFO:
+            self.player = UfoPlayer(player_color)
+        elif new_mode == WAVE:
+            self.player = WavePlayer(player_color)
+        
+        self.player.make_invincible(60)  # Give invincibility after mode change
+        self.emit(EVENT_MODE)
+    
+    def apply_inputs(self, inputs):
+        for action in inputs:
+            if action == JUMP_PRESS:
+                self.jump_held = True
+                self.jumps += 1
+                self.player.jump()
+                self.emit(EVENT_JUMP)
+            elif action == JUMP_RELEASE:
+                self.jump_held = False
+                if self.game_mode in [SHIP, WAVE]:
+                    self.player.release()
+    
+    def step(self, inputs=()):
+        if self.over:
+            return
+        
+        timer = self.timer
+        if timer is not None:
+            timer.start()
+        
+        if inputs and self.replay is not None:
+            self.replay.record(self.ticks, inputs)
+        self.apply_inputs(inputs)
+        self.ticks += 1
+        self.sim_time += SIM_DT
+        
+        player = self.player
+        current_scroll_speed = self.level_data["base_scroll_speed"] * self.game_speed
+        
+        remember_position(player)
+        player.update(current_scroll_speed)
         
-        back_button.check_hover(mouse_pos)
-        if back_button.is_clicked(mouse_pos, mouse_clicked):
-            game_state = MAIN_MENU
-    
-    elif game_state == PLAYING:
-        level_data = LEVELS[current_level]
-        current_scroll_speed = level_data["base_scroll_speed"] * game_speed
+        if timer is not None:
+            timer.lap("update.player")
         
-        player.update(current_scroll_speed)
+        self.ground.update(current_scroll_speed)
         
-        ground.update(current_scroll_speed)
+        self.background.update(current_scroll_speed)
         
-        for bg in bg_elements:
-            bg.update(current_scroll_speed)
+        if timer is not None:
+            timer.lap("update.background")
         
-        for decoration in decorations[:]:
+        retired = 0
+        for decoration in self.decorations:
+            remember_position(decoration)
             decoration.update(current_scroll_speed)
             if decoration.x + decoration.size < 0:
-                decorations.remove(decoration)
+                retired += 1
+        if retired:
+            # One compaction pass instead of a list.remove per decoration
+            kept = []
+            for decoration in self.decorations:
+                if decoration.x + decoration.size < 0:
+                    entity_pool.release(decoration)
+                else:
+                    kept.append(decoration)
+            self.decorations = kept
         
-        current_time = pygame.time.get_ticks()
-        if current_time - obstacle_timer > level_data["obstacle_frequency"] / game_speed:
-            new_obstacles = generate_obstacle_pattern(current_level, WIDTH)
-            obstacles.extend(new_obstacles)
-            obstacle_timer = current_time
-            level_data["obstacle_frequency"] = max(1200, level_data["obstacle_frequency"] - 5)  # Slower difficulty increase
+        if timer is not None:
+            timer.lap("update.decorations")
         
-        for obstacle in obstacles[:]:
-            obstacle.update(current_scroll_speed)
-            
-            if not obstacle.passed and player.x > obstacle.x + (obstacle.width if hasattr(obstacle, 'width') else 30):
-                obstacle.passed = True
-                
-                if not isinstance(obstacle, Portal) and not isinstance(obstacle, SpeedPortal):
-                    score += 1
-                    if score > high_scores[current_level]:
-                        high_scores[current_level] = score
-                        save_game_data()
+        if self.distance >= self.spawn_distance:
+            self.spawn_chunks()
+        
+        if timer is not None:
+            timer.lap("update.spawn")
+        
+        obstacles = self.obstacles
+        obstacles.scroll(current_scroll_speed)
+        self.distance += current_scroll_speed
+        
+        if timer is not None:
+            timer.lap("update.obstacles")
+        
+        for row in obstacles.pass_behind(player.x):
+            if obstacles.kind[row] == KIND_SOLID:
+                self.score += 1
+                if self.record_progress:
+                    if self.score > run_history.best_score(self.level_index):
+                        run_history.note_score(self.level_index, self.score)
+                        save_service.mark_dirty()
+                        self.emit(EVENT_HIGH_SCORE)
                     
-                    check_challenges()
-            
-            if isinstance(obstacle, Portal) and not obstacle.passed and player.get_rect().colliderect(obstacle.get_rect()):
-                obstacle.passed = True
-                change_game_mode(obstacle.target_mode, level_data["player_color"])
+                    self.emit(EVENT_SCORE)
+        
+        hits = obstacles.overlapping(player.get_rect())
+        while hits:
+            row = hits.pop(0)
+            kind = obstacles.kind[row]
             
-            if isinstance(obstacle, SpeedPortal) and not obstacle.passed and player.get_rect().colliderect(obstacle.get_rect()):
-                obstacle.passed = True
-                game_speed = obstacle.speed_multiplier
+            if kind == KIND_PORTAL:
+                if not obstacles.passed[row]:
+                    obstacles.passed[row] = True
+                    if not self.mode_pinned:
+                        self.change_game_mode(obstacles.objects[row].target_mode)
+                        player = self.player
+                        # The new player has a different hitbox, so redo the test for the rest
+                        hits = [i for i in obstacles.overlapping(player.get_rect()) if i > row]
             
-            if obstacle.x + (obstacle.width if hasattr(obstacle, 'width') else 30) < 0:
-                obstacles.remove(obstacle)
+            elif kind == KIND_SPEED_PORTAL:
+                if not obstacles.passed[row]:
+                    obstacles.passed[row] = True
+                    self.game_speed = obstacles.objects[row].speed_multiplier
             
-            # Check for collision with obstacles (except portals and speed portals)
-            if not isinstance(obstacle, Portal) and not isinstance(obstacle, SpeedPortal) and not player.invincible and player.get_rect().colliderect(obstacle.get_rect()):
-                lives -= 1
-                if lives <= 0:
-                    game_state = GAME_OVER
+            elif not player.invincible:
+                self.lives -= 1
+                if self.lives <= 0:
+                    self.over = True
                 else:
                     player.make_invincible(90)  # Give invincibility after hit
         
-        if key_pressed and game_state == PLAYING:
-            if game_mode in [SHIP, WAVE]:
+        self.obstacles.retire_offscreen()
+        
+        if timer is not None:
+            timer.lap("collision")
+        
+        particle_engine.update()
+        
+        if self.jump_held and not self.over:
+            if self.game_mode in [SHIP, WAVE]:
                 player.jump()
-    
-    elif game_state == PAUSE:
-        resume_button = Button(WIDTH//2 - 100, HEIGHT//2 - 30, 200, 60, "Resume")
-        resume_button.check_hover(mouse_pos)
-        if resume_button.is_clicked(mouse_pos, mouse_clicked):
-            game_state = PLAYING
         
-        quit_button = Button(WIDTH//2 - 100, HEIGHT//2 + 50, 200, 60, "Quit to Menu")
-        quit_button.check_hover(mouse_pos)
-        if quit_button.is_clicked(mouse_pos, mouse_clicked):
-            game_state = LEVEL_SELECT
+        if timer is not None:
+            timer.lap("update.particles")
     
+    def render(self, surface, alpha=1.0):
+        timer = self.timer
+        if timer is not None:
+            timer.start()
+        
+        surface.fill(self.level_data["background_color"])
+        
+        self.background.draw(surface, alpha)
+        
+        if timer is not None:
+            timer.lap("draw.background")
+        
+        for decoration in self.decorations:
+            draw_interpolated(decoration, surface, alpha)
+        
+        if timer is not None:
+            timer.lap("draw.decorations")
+        
+        self.ground.draw(surface, alpha)
+        
+        if timer is not None:
+            timer.lap("draw.ground")
+        
+        self.obstacles.sync()
+        for obstacle in self.obstacles:
+            draw_interpolated(obstacle, surface, alpha)
+        
+        if timer is not None:
+            timer.lap("draw.obstacles")
+        
+        particle_engine.draw(surface)
+        
+        if timer is not None:
+            timer.lap("draw.particles")
+        
+        draw_interpolated(self.player, surface, alpha)
+        
+        if timer is not None:
+            timer.lap("draw.player")
+
+REWIND_INTERVAL = 6  # Ticks between the snapshots kept for rewinding
+REWIND_SECONDS = 5
+REWIND_STEP = SIM_HZ  # Ticks to go back per press of the rewind key
+
+class SnapshotRing:
+    # The most recent session snapshots, oldest first; full rings drop the oldest
+    def __init__(self, capacity):
+        self.snapshots = deque(maxlen=capacity)
+    
+    def __len__(self):
+        return len(self.snapshots)
+    
+    def push(self, snapshot):
+        self.snapshots.append(snapshot)
+    
+    def clear(self):
+        self.snapshots.clear()
+    
+    def rewind(self, tick):
+        # Drops every snapshot taken after `tick` and returns the newest one left, or the oldest
+        # if none is that old, so pressing rewind again keeps going further back
+        snapshots = self.snapshots
+        while len(snapshots) > 1 and snapshots[-1]["ticks"] > tick:
+            snapshots.pop()
+        return snapshots[-1] if snapshots else None
+
+def finish_run(died):
+    if session.record_progress:
+        run_history.record(session, died)
+        run_history.flush()
+    if session.replay is not None:
+        session.replay.ticks = session.ticks
+        write_replay(REPLAY_FILE, session.replay)
+    save_service.flush()
+
+def print_run_history():
+    def describe(run):
+        level_index, run_score, jumps, _, _, duration_ms, _ = run
+        return f"{LEVELS[level_index]['name']}: {run_score} points, {jumps} jumps, {duration_ms / 1000:.1f}s"
+    
+    for i, level in enumerate(LEVELS):
+        print(f"{level['name']} (best {run_history.best_score(i)})")
+        for run in run_history.best_runs(level_index=i, limit=5):
+            print("  " + describe(run))
+    for mode, name in enumerate(MODE_NAMES):
+        runs = run_history.best_runs(mode=mode, limit=3)
+        if runs:
+            print(f"Best runs using {name}")
+            for run in runs:
+                print("  " + describe(run))
+
+def draw_scene(alpha=1.0):
     if game_state == MAIN_MENU:
         screen.fill((30, 30, 60))
         
-        for bg in bg_elements:
-            bg.update(1)
-            bg.draw()
+        background.draw(screen)
         
-        title_text = title_font.render("GEOMETRY DASH", True, NEON_BLUE)
-        screen.blit(title_text, (WIDTH//2 - title_text.get_width()//2, 80))
+        screen.blit(main_title_text, (WIDTH//2 - main_title_text.get_width()//2, 80))
         
-        subtitle_text = font.render("Enhanced Edition", True, NEON_PINK)
         screen.blit(subtitle_text, (WIDTH//2 - subtitle_text.get_width()//2, 140))
         
         for button in main_menu_buttons:
             button.draw()
         
-        version_text = small_font.render("v2.0 Ultimate Edition", True, WHITE)
         screen.blit(version_text, (WIDTH - version_text.get_width() - 10, HEIGHT - 30))
     
     elif game_state == LEVEL_SELECT:
         screen.fill((30, 30, 60))
         
-        for bg in bg_elements:
-            bg.update(1)
-            bg.draw()
+        background.draw(screen)
         
-        title_text = title_font.render("SELECT LEVEL", True, NEON_ORANGE)
-        screen.blit(title_text, (WIDTH//2 - title_text.get_width()//2, 50))
+        screen.blit(level_select_title_text, (WIDTH//2 - level_select_title_text.get_width()//2, 50))
         
         for button in level_buttons:
             button.draw()
@@ -1432,8 +3139,7 @@ while running:
     elif game_state == CHALLENGES:
         screen.fill((30, 30, 60))
         
-        title_text = title_font.render("CHALLENGES", True, NEON_GREEN)
-        screen.blit(title_text, (WIDTH//2 - title_text.get_width()//2, 50))
+        screen.blit(challenges_title_text, (WIDTH//2 - challenges_title_text.get_width()//2, 50))
         
         for button in challenge_buttons:
             button.draw()
@@ -1441,98 +3147,581 @@ while running:
         back_button.draw()
     
     elif game_state == PLAYING or game_state == PAUSE:
-        level_data = LEVELS[current_level]
-        
-        screen.fill(level_data["background_color"])
-        
-        for bg in bg_elements:
-            bg.draw()
-        
-        for decoration in decorations:
-            decoration.draw()
-        
-        ground.draw()
-        
-        for obstacle in obstacles:
-            obstacle.draw()
-        
-        player.draw()
-        
-        score_text = font.render(f'Score: {score}', True, WHITE)
-        screen.blit(score_text, (10, 10))
-        
-        high_score_text = font.render(f'High Score: {high_scores[current_level]}', True, WHITE)
-        screen.blit(high_score_text, (10, 40))
-        
-        level_text = font.render(f'Level: {level_data["name"]}', True, WHITE)
-        screen.blit(level_text, (WIDTH - level_text.get_width() - 10, 10))
+        # While profiling, everything drawn on the screen goes through a counter
+        target = DrawCounter(screen) if session.timer is not None else screen
+        session.render(target, alpha)
         
-        mode_names = ["CUBE", "SHIP", "BALL", "UFO", "WAVE"]
-        mode_text = small_font.render(f'Mode: {mode_names[game_mode]}', True, WHITE)
-        screen.blit(mode_text, (WIDTH - mode_text.get_width() - 10, 40))
+        hud.draw(target, session.score, session.best_score(), session.lives, session.level_data["name"], session.game_mode, session.game_speed)
         
-        speed_text = small_font.render(f'Speed: {game_speed}x', True, WHITE)
-        screen.blit(speed_text, (WIDTH - speed_text.get_width() - 10, 70))
-        
-        # Draw lives
-        lives_text = font.render(f'Lives: {lives}', True, WHITE)
-        screen.blit(lives_text, (10, 70))
+        if session.timer is not None:
+            session.timer.lap("draw.hud")
+        if profiler.visible:
+            profiler.draw(target, session)
+            if session.timer is not None:
+                session.timer.lap("draw.profiler")
+        if session.timer is not None:
+            session.timer.count("draw calls", target.calls)
         
         if game_state == PAUSE:
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 128))
             screen.blit(overlay, (0, 0))
             
-            pause_text = title_font.render("PAUSED", True, WHITE)
             screen.blit(pause_text, (WIDTH//2 - pause_text.get_width()//2, HEIGHT//2 - 120))
             
-            resume_button = Button(WIDTH//2 - 100, HEIGHT//2 - 30, 200, 60, "Resume")
-            resume_button.check_hover(mouse_pos)
             resume_button.draw()
-            
-            quit_button = Button(WIDTH//2 - 100, HEIGHT//2 + 50, 200, 60, "Quit to Menu")
-            quit_button.check_hover(mouse_pos)
             quit_button.draw()
     
     elif game_state == GAME_OVER:
-        level_data = LEVELS[current_level]
-        
-        screen.fill(level_data["background_color"])
-        for bg in bg_elements:
-            bg.draw()
-        for decoration in decorations:
-            decoration.draw()
-        ground.draw()
-        for obstacle in obstacles:
-            obstacle.draw()
-        player.draw()
-        
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
+        session.render(screen)
+        
         screen.blit(overlay, (0, 0))
         
-        game_over_text = title_font.render("GAME OVER", True, RED)
         screen.blit(game_over_text, (WIDTH//2 - game_over_text.get_width()//2, HEIGHT//2 - 100))
         
-        score_text = font.render(f'Final Score: {score}', True, WHITE)
+        score_text = final_score_label.update(session.score)
         screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2 - 50))
         
-        if score > high_scores[current_level]:
-            high_score_text = font.render(f'New High Score!', True, NEON_GREEN)
+        if session.score > session.best_score():
+            high_score_text = new_high_score_text
         else:
-            high_score_text = font.render(f'High Score: {high_scores[current_level]}', True, WHITE)
+            high_score_text = game_over_high_score_label.update(session.best_score())
         screen.blit(high_score_text, (WIDTH//2 - high_score_text.get_width()//2, HEIGHT//2))
         
-        restart_text = font.render('Press SPACE to return to level select', True, WHITE)
         screen.blit(restart_text, (WIDTH//2 - restart_text.get_width()//2, HEIGHT//2 + 50))
         
         if any(not c["completed"] for c in CHALLENGES):
-            challenge_text = small_font.render('Check the Challenges menu for new goals!', True, CYAN)
-            screen.blit(challenge_text, (WIDTH//2 - challenge_text.get_width()//2, HEIGHT//2 + 100))
-    
-    pygame.display.flip()
+            screen.blit(challenge_hint_text, (WIDTH//2 - challenge_hint_text.get_width()//2, HEIGHT//2 + 100))
+
+def tap_policy(interval):
+    # Press jump for one tick every `interval` ticks; enough to keep a headless run moving
+    def policy(session):
+        phase = session.ticks % interval
+        if phase == 0:
+            return (JUMP_PRESS,)
+        if phase == 1:
+            return (JUMP_RELEASE,)
+        return ()
+    return policy
+
+BOT_SEARCH = {
+    # Ticks per decision, decisions looked ahead, and whether to prefer whichever input steers
+    # toward the middle of the screen over letting go. The cube's horizon has to outlast its jump
+    # arc (about 30 ticks) or it takes jumps it can't land; the flying modes climb too slowly to
+    # reach a gap they only see a few ticks ahead, so they keep to the middle
+    CubePlayer: (6, 6, False),
+    ShipPlayer: (4, 6, True),
+    BallPlayer: (5, 6, False),
+    UfoPlayer: (5, 6, True),
+    WavePlayer: (3, 6, True),
+}
+BOT_SEARCH_BUDGET = 1000  # Probes per decision before the bot gives up and plays on blind
+
+def solid_contact(session):
+    obstacles = session.obstacles
+    return any(obstacles.kind[row] == KIND_SOLID for row in obstacles.overlapping(session.player.get_rect()))
+
+class SearchBot:
+    # A policy that plays ahead on the session itself, restoring it after every probe. Each
+    # decision covers a few ticks and either keeps the jump key as it is or flips it on one of
+    # those ticks, so taps can land on any tick while the tree stays shallow. Touching a solid
+    # fails a probe even while invincible, so a run the bot clears is one a player can clear
+    def __init__(self):
+        self.plan = []  # Inputs for the rest of the current decision, last tick first
+        self.probes = 0
+        self.decisions = 0
+        self.forced = 0  # Decisions where the preferred input would have hit something
+        self.blind = 0  # Decisions where nothing survived the whole horizon
+    
+    def __call__(self, session):
+        if self.plan:
+            return self.plan.pop()
+        
+        segment, depth, _ = BOT_SEARCH[type(session.player)]
+        self.decisions += 1
+        self.probes = 0
+        options = self.options(session, segment)
+        flip = self.search(session, segment, depth)
+        if flip is False:
+            self.blind += 1
+            flip = options[0]
+        elif flip != options[0]:
+            self.forced += 1
+        
+        self.plan = [()] * segment
+        if flip is not None:
+            self.plan[segment - 1 - flip] = (JUMP_RELEASE,) if session.jump_held else (JUMP_PRESS,)
+        return self.plan.pop()
+    
+    def options(self, session, segment):
+        # Ticks to flip the jump key on, None for leaving it; the preferred input is tried first
+        steer = BOT_SEARCH[type(session.player)][2]
+        preferred = steer and session.player.y > HEIGHT // 2
+        first = [None, 0] if preferred == session.jump_held else [0, None]
+        return first + list(range(1, segment))
+    
+    def search(self, session, segment, depth):
+        # The first option that stays clear for `depth` decisions, or False if none does
+        snapshot = session.snapshot()
+        seen = set()
+        for flip in self.options(session, segment):
+            if self.probes >= BOT_SEARCH_BUDGET:
+                break
+            self.probes += 1
+            clear = self.advance(session, flip, segment)
+            if clear and depth > 1:
+                # Taps in mid-air change nothing, so options that end up where a failed one did are skipped
+                key = self.state_key(session)
+                clear = key not in seen and self.search(session, segment, depth - 1) is not False
+                seen.add(key)
+            session.restore(snapshot)
+            if clear:
+                return flip
+        return False
+    
+    def state_key(self, session):
+        player = session.player
+        return (type(player), session.jump_held, session.game_speed,
+                tuple(value for value in vars(player).values() if isinstance(value, (int, float))))
+    
+    def advance(self, session, flip, segment):
+        edge = (JUMP_RELEASE,) if session.jump_held else (JUMP_PRESS,)
+        for tick in range(segment):
+            session.step(edge if tick == flip else ())
+            if solid_contact(session):
+                return False
+        return True
+
+def run_headless(level_index, ticks, policy=None, seed=None, level_file=None):
+    session = GameSession(level_index, record_progress=False, seed=seed, level_file=level_file)
+    for _ in range(ticks):
+        session.step(policy(session) if policy is not None else ())
+        if session.over:
+            break
+    return session
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {text}")
+    return value
+
+def positive_float(text):
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, not {text}")
+    return value
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Geometry Dash Clone")
+    parser.add_argument("--fps", type=int, default=FPS, help="display frame rate; gameplay always ticks at %d Hz" % SIM_HZ)
+    parser.add_argument("--dirty-rects", action="store_true", help="only update changed screen regions")
+    parser.add_argument("--hq-background", action="store_true", help="rotate every background element individually")
+    parser.add_argument("--headless", action="store_true", help="simulate without a window and print a summary")
+    parser.add_argument("--level", type=int, default=0, choices=range(len(LEVELS)), help="level index for --headless and --export-level")
+    parser.add_argument("--ticks", type=int, default=None,
+                        help="ticks to simulate with --headless (10000), per --benchmark run (1200) or per --validate run (1800)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for --headless, or the first seed for --validate")
+    parser.add_argument("--level-file", default=None, help="play a level file written by --export-level")
+    parser.add_argument("--export-level", metavar="PATH", default=None, help="compile --level into a level file and exit")
+    parser.add_argument("--chunks", type=int, default=1000, help="patterns to compile with --export-level")
+    parser.add_argument("--history", action="store_true", help="print the best recorded runs and exit")
+    parser.add_argument("--profile-csv", metavar="PATH", default=None, help="write per-frame profiler timings while playing to PATH")
+    parser.add_argument("--benchmark", metavar="PATH", nargs="?", const="", default=None,
+                        help="time update, collision and draw for every level and mode; p50/p95/p99 go to PATH as JSON")
+    parser.add_argument("--validate", metavar="RUNS", type=positive_int, default=None,
+                        help="play RUNS seeds of every level with search bots and report the ones that can't be survived")
+    parser.add_argument("--workers", type=positive_int, default=None, help="processes for --validate (one per CPU)")
+    parser.add_argument("--replay", metavar="PATH", nargs="?", const=REPLAY_FILE, default=None,
+                        help="watch a recorded run (default: the last one), or re-simulate it with --headless")
+    parser.add_argument("--replay-speed", type=positive_float, default=1.0, help="playback speed multiplier for --replay")
+    return parser.parse_args(argv)
+
+BENCHMARK_PHASES = ("update", "collision", "draw", "frame")
+
+def run_benchmark(ticks, seed=1, path=None):
+    # Every level in every player mode, one tick and one offscreen render per frame
+    init_display(headless=True)
+    target = pygame.Surface((WIDTH, HEIGHT)).convert()
+    policy = tap_policy(40)
+    runs = []
+    for level_index, level in enumerate(LEVELS):
+        for mode, mode_name in enumerate(MODE_NAMES):
+            run = GameSession(level_index, record_progress=False, seed=seed)
+            if mode != CUBE:
+                run.change_game_mode(mode)
+            run.mode_pinned = True  # Otherwise the level's portals switch modes and the rows mix them
+            run.lives = math.inf  # Scripted runs always last the full length
+            timer = PhaseTimer()
+            run.timer = timer
+            
+            for _ in range(ticks):
+                frame_start = time.perf_counter()
+                run.step(policy(run))
+                run.render(target)
+                timer.current["frame"] = time.perf_counter() - frame_start
+                timer.end_frame()
+            
+            result = {"level": level["name"], "mode": mode_name, "score": run.score}
+            for phase in BENCHMARK_PHASES:
+                result[phase] = timer.percentiles(phase)
+            runs.append(result)
+            print(f"{level['name']:<16} {mode_name:<5} " +
+                  "  ".join(f"{phase} {result[phase]['p50']:.3f}/{result[phase]['p95']:.3f}/{result[phase]['p99']:.3f}"
+                            for phase in BENCHMARK_PHASES))
+    
+    report = {
+        "build": {
+            "python": sys.version.split()[0],
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__ if np is not None else None,
+            "hq_background": HIGH_QUALITY_BACKGROUND,
+        },
+        "ticks": ticks,
+        "seed": seed,
+        "units": "ms",
+        "runs": runs,
+    }
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def validate_run(job):
+    level_index, seed, ticks = job
+    session = GameSession(level_index, record_progress=False, seed=seed)
+    bot = SearchBot()
+    hits = []
+    while session.ticks < ticks and not session.over:
+        lives = session.lives
+        session.step(bot(session))
+        if session.lives < lives:
+            # Blame the pattern the obstacle that was hit belongs to; the player may not have reached it
+            obstacles = session.obstacles
+            rows = [row for row in obstacles.overlapping(session.player.get_rect()) if obstacles.kind[row] == KIND_SOLID]
+            x = session.distance + (float(obstacles.x[rows[0]]) if rows else session.player.x)
+            hits.append((session.ticks,) + session.timeline.patterns_at(x))
+    return {
+        "level": level_index,
+        "seed": seed,
+        "ticks": session.ticks,
+        "score": session.score,
+        "hits": hits,
+        "difficulty": bot.forced / max(bot.decisions, 1),  # Share of decisions where the preferred input would hit
+        "blind": bot.blind,
+    }
+
+def percentile(values, fraction):
+    # Nearest rank over sorted values
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+def run_validation(runs, ticks, first_seed=0, workers=None):
+    # Seeds first_seed.. on every level, spread over a process pool; each run is independent
+    jobs = [(level_index, first_seed + i, ticks) for level_index in range(len(LEVELS)) for i in range(runs)]
+    start = time.perf_counter()
+    # The workers never draw, so they skip init_display; SDL would also turn the pool's SIGTERM into a quit event
+    with multiprocessing.Pool(workers) as pool:
+        results = list(pool.imap_unordered(validate_run, jobs, chunksize=max(1, len(jobs) // 256)))
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda result: (result["level"], result["seed"]))
+    print(f"Validated {len(results)} runs of {ticks} ticks in {elapsed:.1f}s ({len(results) / max(elapsed, 1e-9):.1f} runs/s)")
+    
+    for level_index, level in enumerate(LEVELS):
+        level_results = [result for result in results if result["level"] == level_index]
+        difficulty = sorted(result["difficulty"] for result in level_results)
+        cleared = sum(1 for result in level_results if not result["hits"])
+        print(f"{level['name']}: {cleared}/{len(level_results)} cleared, difficulty p10/p50/p90/max " +
+              "/".join(f"{percentile(difficulty, fraction):.3f}" for fraction in (0.1, 0.5, 0.9, 1.0)))
+        counts = [0] * 10
+        for value in difficulty:
+            counts[min(9, int(value * 40))] += 1  # Bins of 0.025; anything above 0.25 goes in the last
+        print("  " + " ".join(f"{i * 0.025:.3f}:{count}" for i, count in enumerate(counts) if count))
+    
+    failed = [result for result in results if result["hits"]]
+    if failed:
+        print("Unsurvivable seeds:")
+        pairs = {}
+        for result in failed:
+            tick, previous, pattern = result["hits"][0]  # Later hits follow on from the first one
+            pairs[(previous, pattern)] = pairs.get((previous, pattern), 0) + 1
+            print(f"  {LEVELS[result['level']]['name']} seed {result['seed']}: hit at tick {tick} in {pattern} after {previous}"
+                  f" ({result['blind']} decisions without a way through)")
+        print("Pattern pairs behind the first hit:")
+        for (previous, pattern), count in sorted(pairs.items(), key=lambda item: -item[1]):
+            print(f"  {count:5d}  {previous} -> {pattern}")
+    return results
+
+def main_headless(args):
+    # Files are opened first so a bad one is reported before anything starts
+    replay = level_file = None
+    if args.replay:
+        replay = open_replay(args.replay)
+        if replay is None:
+            return
+    elif args.level_file:
+        level_file = open_level_file(args.level_file)
+        if level_file is None:
+            return
+    
+    init_display(headless=True)
+    start = time.perf_counter()
+    if replay is not None:
+        session = run_headless(replay.level_index, replay.ticks, replay.policy(), replay.seed)
+    else:
+        ticks = args.ticks if args.ticks is not None else 10000
+        session = run_headless(args.level, ticks, tap_policy(40), args.seed, level_file)
+        session.close()
+    elapsed = time.perf_counter() - start
+    print(f"Level: {session.level_data['name']}  Seed: {session.seed}")
+    print(f"Ticks: {session.ticks} ({session.ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    print(f"Score: {session.score}  Lives: {session.lives}  Game over: {session.over}")
+
+def main(argv=None):
+    global game_state, current_level, session, background, hud, HIGH_QUALITY_BACKGROUND, DISPLAY_FPS
+    
+    args = parse_args(argv)
+    HIGH_QUALITY_BACKGROUND = args.hq_background
+    if args.benchmark is not None:
+        print("Frame times in ms as p50/p95/p99")
+        run_benchmark(args.ticks if args.ticks is not None else 1200, args.seed if args.seed is not None else 1, args.benchmark)
+        if args.benchmark:
+            print(f"Wrote {args.benchmark}")
+        return
+    if args.validate is not None:
+        run_validation(args.validate, args.ticks if args.ticks is not None else 1800, args.seed or 0, args.workers)
+        return
+    if args.export_level:
+        chunks, records = export_level(args.export_level, args.level, args.chunks, args.seed)
+        print(f"Wrote {args.export_level}: {chunks} chunks, {records} records")
+        return
+    if args.headless:
+        main_headless(args)
+        return
+    if args.history:
+        run_history.open()
+        load_game_data()
+        print_run_history()
+        run_history.close()
+        return
+    
+    level_file = None
+    if args.level_file:
+        level_file = open_level_file(args.level_file)
+        if level_file is None:
+            return
+    playback = None  # The replay being watched; its edges stand in for the keyboard
+    if args.replay:
+        playback = open_replay(args.replay)
+        if playback is None:
+            return
+    
+    DISPLAY_FPS = args.fps
+    if args.profile_csv:
+        profiler.open_trace(args.profile_csv)
+    renderer.enabled = args.dirty_rects
+    
+    init_display()
+    init_menu_texts()
+    if level_file is None:
+        # Get the menu on screen first; the save, run history and HUD glyphs load behind it
+        draw_scene()
+        pygame.display.flip()
+    run_history.open()
+    load_game_data()
+    hud = Hud()
+    
+    if level_file is not None:
+        # Straight into the authored level; the menus take over once it ends
+        current_level = args.level
+        session = GameSession(current_level, level_file=level_file)
+        background = session.background
+        game_state = PLAYING
+    
+    time_scale = 1.0
+    if playback is not None:
+        playback_inputs = playback.policy()
+        current_level = playback.level_index
+        session = GameSession(current_level, record_progress=False, seed=playback.seed)
+        session.replay = None  # Watching a run doesn't replace the last one recorded
+        background = session.background
+        game_state = PLAYING
+        time_scale = args.replay_speed
+    
+    running = True
+    mouse_clicked = False
+    pending_inputs = []  # Jump edges seen since the last tick
+    rewind_ring = SnapshotRing(REWIND_SECONDS * SIM_HZ // REWIND_INTERVAL)
+    checkpoint = None
+    restored = None
+    accumulator = 0.0
     
-    clock.tick(FPS)
+    while running:
+        accumulator += min(clock.tick(DISPLAY_FPS), MAX_FRAME_TIME) * time_scale
+        
+        mouse_pos = pygame.mouse.get_pos()
+        mouse_clicked = False
+        
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    if game_state == PLAYING:
+                        pending_inputs.append(JUMP_PRESS)
+                    elif game_state == GAME_OVER:
+                        game_state = LEVEL_SELECT
+                    elif game_state == PAUSE:
+                        game_state = PLAYING
+                
+                if event.key == pygame.K_ESCAPE:
+                    if game_state == PLAYING:
+                        game_state = PAUSE
+                        save_service.flush()
+                    elif game_state == PAUSE:
+                        game_state = PLAYING
+                    elif game_state in [LEVEL_SELECT, CHALLENGES]:
+                        game_state = MAIN_MENU
+                    elif game_state == MAIN_MENU:
+                        running = False
+            
+                if event.key == pygame.K_F3 and game_state in [PLAYING, PAUSE]:
+                    profiler.toggle()
+                
+                # Practice: C drops a checkpoint, X goes back to it and Backspace rewinds a second
+                if event.key == pygame.K_c and game_state == PLAYING:
+                    checkpoint = session.snapshot()
+                if event.key == pygame.K_x and game_state in [PLAYING, GAME_OVER] and checkpoint is not None:
+                    restored = checkpoint
+                if event.key == pygame.K_BACKSPACE and game_state in [PLAYING, GAME_OVER]:
+                    restored = rewind_ring.rewind(session.ticks - REWIND_STEP)
+            
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_SPACE:
+                    if session is not None:
+                        pending_inputs.append(JUMP_RELEASE)
+            
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                mouse_clicked = True
+            
+            if event.type == pygame.VIDEOEXPOSE:
+                renderer.invalidate()
+        
+        if game_state == MAIN_MENU:
+            for i, button in enumerate(main_menu_buttons):
+                button.check_hover(mouse_pos)
+                if button.is_clicked(mouse_pos, mouse_clicked):
+                    if i == 0:
+                        game_state = LEVEL_SELECT
+                    elif i == 1:
+                        game_state = CHALLENGES
+                    elif i == 2:
+                        running = False
+        
+        elif game_state == LEVEL_SELECT:
+            for i, button in enumerate(level_buttons):
+                button.locked = i > 0 and run_history.best_score(i-1) < 10  # Easier to unlock levels
+                button.check_hover(mouse_pos)
+                if button.is_clicked(mouse_pos, mouse_clicked):
+                    current_level = i
+                    if session is not None:
+                        session.close()
+                    session = GameSession(current_level)
+                    background = session.background
+                    pending_inputs = []
+                    playback = None
+                    time_scale = 1.0
+                    rewind_ring.clear()
+                    checkpoint = None
+                    game_state = PLAYING
+            
+            back_button.check_hover(mouse_pos)
+            if back_button.is_clicked(mouse_pos, mouse_clicked):
+                game_state = MAIN_MENU
+        
+        elif game_state == CHALLENGES:
+            for button in challenge_buttons:
+                button.check_hover(mouse_pos)
+            
+            back_button.check_hover(mouse_pos)
+            if back_button.is_clicked(mouse_pos, mouse_clicked):
+                game_state = MAIN_MENU
+        
+        elif game_state == PAUSE:
+            resume_button.check_hover(mouse_pos)
+            if resume_button.is_clicked(mouse_pos, mouse_clicked):
+                game_state = PLAYING
+            
+            quit_button.check_hover(mouse_pos)
+            if quit_button.is_clicked(mouse_pos, mouse_clicked):
+                game_state = LEVEL_SELECT
+                finish_run(died=False)
+        
+        if restored is not None:
+            if session.record_progress:
+                # Practice runs can't set high scores, so the run is recorded as it stood
+                if game_state != GAME_OVER:
+                    finish_run(died=False)
+                session.record_progress = False
+            session.restore(restored)
+            pending_inputs = []
+            accumulator = 0.0
+            if playback is not None:
+                time_scale = args.replay_speed  # Rewinding a finished replay plays on at its speed
+            game_state = PLAYING
+            restored = None
+        
+        profiling = profiler.active and game_state == PLAYING
+        if session is not None:
+            session.timer = profiler.timer if profiling else None
+        
+        while accumulator >= SIM_DT:
+            accumulator -= SIM_DT
+            
+            if game_state == PLAYING:
+                if session.ticks % REWIND_INTERVAL == 0:
+                    rewind_ring.push(session.snapshot())
+                if playback is not None:
+                    pending_inputs = playback_inputs(session)
+                session.step(pending_inputs)
+                pending_inputs = []
+                if session.over:
+                    game_state = GAME_OVER
+                    finish_run(died=True)
+                elif playback is not None and session.ticks >= playback.ticks:
+                    game_state = GAME_OVER  # Where the recorded run was quit
+                if game_state == GAME_OVER:
+                    time_scale = 1.0  # The game over screen and the menus run in real time
+            
+            elif game_state in [MAIN_MENU, LEVEL_SELECT]:
+                if renderer.tracking:
+                    background.mark_dirty()
+                background.update(1)
+                if renderer.tracking:
+                    background.mark_dirty()
+        
+        renderer.begin(game_state)
+        if game_state == PLAYING:
+            renderer.invalidate()  # The playfield scrolls, so every pixel changes
+        
+        if renderer.needs_redraw():
+            # Render between the last two ticks while playing; frozen screens show the latest tick
+            draw_scene(accumulator / SIM_DT if game_state == PLAYING else 1.0)
+        
+        if profiling:
+            profiler.timer.start()
+        renderer.present()
+        if profiling:
+            profiler.timer.lap("flip")
+            profiler.end_frame(session)
+    
+    profiler.close()
+    if game_state in [PLAYING, PAUSE]:
+        finish_run(died=False)
+    if session is not None:
+        session.close()
+    run_history.close()
+    save_service.close()
+    pygame.quit()
 
-pygame.quit()
-sys.exit()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
+    sys.exit()